@@ -3,6 +3,10 @@ Comber
 
 """
 from math import inf
-from .parser import ParseError, EndOfInputError, Emitter
+from .parser import ParseError, EndOfInputError, Emitter, Token, takesTokens, Handler
 from .combinator import Combinator, C, Id, Lit, Seq, Choice, Repeat
 from .extras import cs, rs, defer
+from .compiler import compile, generate
+from .vm import assemble
+from .tree import compact, CompactTree
+from .binary import field, magic, blob, records, align
@@ -0,0 +1,229 @@
+"""
+Parsers for binary formats: fixed-width fields, magic constants, length-prefixed blobs and arrays of records. They
+only parse bytes input, and no bytes are insignificant, so they raise a ValueError if they're run with whitespace -
+binary grammars have to set theirs to None.
+"""
+from abc import abstractmethod
+from typing import Any, List, Optional
+from array import array
+import struct
+import sys
+from .parser import State, Expect
+from .combinator import Combinator
+
+_ORDERS = '@=<>!'
+_NATIVE = ('@', '=', '<' if sys.byteorder == 'little' else '>') + (('!', ) if sys.byteorder == 'big' else ())
+# Struct codes of fields that array and memoryview.cast can hold
+_NUMBERS = 'bBhHiIlLqQfd'
+
+
+def prefixLength(prefix:struct.Struct, state:State) -> Optional[int]:
+    """
+    Read a length prefix at the current offset, or None if the input is too short.
+    """
+    if state.pos + prefix.size > len(state.source):
+        return None
+    return prefix.unpack_from(state.source, state.pos)[0]
+
+
+class Binary(Combinator):
+    """
+    Base of the binary parsers.
+    """
+    recurse = True # As an optimization - there's no way a binary parser can recurse, so don't check
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.whitespace = None
+
+    def recognize(self, state:State) -> Optional[State]:
+        if state.whitespace is not None:
+            # Skipping it would silently drop field bytes that happen to be spaces, tabs or newlines
+            raise ValueError(f'{self!r} parses binary input, so the grammar must set whitespace to None')
+        return self.read(state)
+
+    @abstractmethod
+    def read(self, state:State) -> Optional[State]:
+        """
+        Parse the binary data at the current offset (see Parser.recognize).
+        """
+
+    def firstSet(self) -> frozenset[str]|None:
+        return None
+
+
+#pylint: disable=invalid-name
+class field(Binary):
+    """
+    Parse a fixed-width field, given as a struct format. The leaf is the unpacked value, or a tuple of them if the
+    format has more than one.
+    """
+    def __init__(self, fmt:str) -> None:
+        super().__init__()
+        self.fmt = fmt
+        self._struct = struct.Struct(fmt)
+        self._single = len(self._struct.unpack(bytes(self._struct.size))) == 1
+
+    def expect(self, state:Expect) -> List[str]:
+        return [f'<{self.fmt}>']
+
+    def isNullable(self) -> bool:
+        return not self._struct.size
+
+    def read(self, state:State) -> Optional[State]:
+        if state.pos + self._struct.size > len(state.source):
+            state.fail(self, state.pos)
+            return None
+
+        values = self._struct.unpack_from(state.source, state.pos)
+        state.take(self._struct.size, values[0] if self._single else values)
+        return state
+
+    def repr(self) -> str:
+        return f'field({self.fmt})'
+
+
+#pylint: disable=invalid-name
+class magic(Binary):
+    """
+    Parse an exact sequence of bytes.
+    """
+    def __init__(self, data:bytes) -> None:
+        super().__init__()
+        self.data = data
+
+    def expect(self, state:Expect) -> List[str]:
+        return [repr(self.data)]
+
+    def isNullable(self) -> bool:
+        return not self.data
+
+    def read(self, state:State) -> Optional[State]:
+        if state.source[state.pos:state.pos + len(self.data)] != self.data:
+            state.fail(self, state.pos)
+            return None
+
+        state.take(len(self.data), self.data)
+        return state
+
+    def repr(self) -> str:
+        return f'magic({self.data!r})'
+
+
+#pylint: disable=invalid-name
+class blob(Binary):
+    """
+    Parse a run of bytes preceded by its length, given as a struct format. The leaf is the bytes, sliced from the input.
+    """
+    def __init__(self, prefix:str) -> None:
+        super().__init__()
+        self.prefix = prefix
+        self._prefix = struct.Struct(prefix)
+
+    def expect(self, state:Expect) -> List[str]:
+        return [f'<{self.prefix} blob>']
+
+    def read(self, state:State) -> Optional[State]:
+        length = prefixLength(self._prefix, state)
+        start = state.pos + self._prefix.size
+
+        if length is None or start + length > len(state.source):
+            state.fail(self, state.pos)
+            return None
+
+        state.take(self._prefix.size + length, state.source[start:start + length])
+        return state
+
+    def repr(self) -> str:
+        return f'blob({self.prefix})'
+
+
+#pylint: disable=invalid-name
+class records(Binary):
+    """
+    Parse an array of fixed-size records, given as a struct format, all at once. The count is either a number, or the
+    struct format of a prefix holding it.
+
+    If a record is a single number, the leaf is a memoryview of the input cast to it, or an array.array if the byte
+    order isn't the machine's. Otherwise, it's a list of tuples.
+    """
+    def __init__(self, fmt:str, count:int|str) -> None:
+        super().__init__()
+        self.fmt = fmt
+        self.count = count
+        self._struct = struct.Struct(fmt)
+        self._prefix = struct.Struct(count) if isinstance(count, str) else None
+
+        order = fmt[0] if fmt[0] in _ORDERS else '@'
+        code = fmt.lstrip(_ORDERS)
+        single = len(code) == 1 and code in _NUMBERS and self._struct.size == struct.calcsize('@' + code)
+        # How a whole array is read: straight from the buffer, by copying and swapping bytes, or record by record
+        self._cast = code if single and order in _NATIVE else None
+        self._swap = code if single and order not in _NATIVE else None
+
+    def expect(self, state:Expect) -> List[str]:
+        return [f'<{self.count} x {self.fmt}>']
+
+    def isNullable(self) -> bool:
+        return self.count == 0 or not self._struct.size
+
+    def read(self, state:State) -> Optional[State]:
+        if self._prefix is None:
+            count:int|None = int(self.count)
+            start = state.pos
+        else:
+            count = prefixLength(self._prefix, state)
+            start = state.pos + self._prefix.size
+
+        end = start + self._struct.size * (count or 0)
+
+        if count is None or end > len(state.source):
+            state.fail(self, state.pos)
+            return None
+
+        data = memoryview(state.source)[start:end] # type: ignore[arg-type]
+        value:Any
+
+        if self._cast:
+            value = data.cast(self._cast)
+        elif self._swap:
+            value = array(self._swap)
+            value.frombytes(data)
+            value.byteswap()
+        else:
+            value = list(self._struct.iter_unpack(data))
+
+        state.take(end - state.pos, value)
+        return state
+
+    def repr(self) -> str:
+        return f'records({self.fmt}, {self.count})'
+
+
+#pylint: disable=invalid-name
+class align(Binary):
+    """
+    Skip padding up to the next multiple of a number of bytes from the start of the input. It adds no leaf.
+    """
+    def __init__(self, size:int) -> None:
+        super().__init__()
+        self.size = size
+
+    def expect(self, state:Expect) -> List[str]:
+        return [f'<align {self.size}>']
+
+    def isNullable(self) -> bool:
+        return True
+
+    def read(self, state:State) -> Optional[State]:
+        end = state.pos + -(state.base + state.pos) % self.size
+
+        if end > len(state.source):
+            state.fail(self, state.pos)
+            return None
+
+        state.pos = end
+        return state
+
+    def repr(self) -> str:
+        return f'align({self.size})'
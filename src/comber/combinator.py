@@ -1,14 +1,62 @@
 """
 Combinator definitions.
 """
-from typing import cast, Optional, Tuple, List, Union, Any
+from typing import cast, Optional, Tuple, List, Union, Any, Callable, Iterable, Iterator
+from collections import deque
+from types import MethodType
+from concurrent.futures import Future, ProcessPoolExecutor
 import weakref
+import re
+import os
+import mmap
+import sys
+from itertools import count, islice
 from math import inf
 from abc import ABC
-from .parser import Parser, State, Expect, Emitter, ParseError
+from .parser import Parser, State, Expect, Emitter, ParseError, LineIndex, Source, MEMO_SIZE, CHUNK_SIZE, deepRecursion
 
 Parseable = Union['Combinator', str]
 
+Boundary = Union['Combinator', str, bytes, re.Pattern]
+""" Where a large input can be split: a parser, or a regular expression (see Combinator.parseSplit) """
+
+UNROLL_LIMIT = 16
+""" Bounded repeats of up to this many items are written out in full when fusing them into a pattern """
+
+_atomicNames = count()
+
+def atomic(pattern:str) -> str:
+    """
+    A pattern that matches like the given one, but never backtracks into what it matched - as a PEG parser would.
+    """
+    if sys.version_info >= (3, 11):
+        return f'(?>{pattern})'
+
+    # A lookahead never backtracks, so match ahead, then take exactly what the lookahead found
+    name = f'_a{next(_atomicNames)}'
+    return f'(?=(?P<{name}>{pattern}))(?P={name})'
+
+
+def leafPattern(pattern:str, white:str, leaves:list[str]) -> str:
+    """
+    A pattern for a parser that produces a leaf: the match is captured in a new group named in leaves, then any
+    whitespace is skipped.
+    """
+    name = f'_{len(leaves)}'
+    leaves.append(name)
+    return atomic(f'(?P<{name}>{pattern}){white}')
+
+
+def whitePattern(whitespace:str|None) -> str:
+    """
+    A pattern skipping a run of the given whitespace characters. It's only used inside a leaf's atomic group, so it
+    doesn't need one of its own.
+    """
+    if not whitespace:
+        return ''
+
+    return '[' + re.escape(whitespace) + ']*'
+
 class Combinator(Parser, ABC):
     """
     Combinator definitions.
@@ -54,13 +102,65 @@ class Combinator(Parser, ABC):
         """ Return a simplified version of the combinator """
         return self
 
-    def analyze(self) -> None:
+    def children(self) -> tuple['Combinator', ...]:
+        """ The subparsers of this combinator """
+        return ()
+
+    def leftChildren(self) -> tuple['Combinator', ...]:
+        """ The subparsers that may be run at the same offset as this combinator """
+        return self.children()
+
+    def isNullable(self) -> bool:
+        """ Whether this combinator can succeed without consuming input, given what's known about its subparsers """
+        return False
+
+    def firstSet(self) -> frozenset[str]|None:
+        """
+        The characters a match of this combinator can start with, given what's known about its subparsers, or None if
+        it could be anything.
+        """
+        first:set[str] = set()
+
+        for parser in self.leftChildren():
+            if parser.first is None:
+                return None
+            first.update(parser.first)
+
+        return frozenset(first)
+
+    def prepare(self) -> None:
+        """ Build any lookup tables, once the grammar has been analyzed """
+
+    def replaceChildren(self, replacements:dict[int, 'Combinator']) -> None:
+        """ Swap subparsers for their replacements, by the id of the subparser """
+
+    def isRegular(self) -> bool:
+        """ Whether this combinator can be written as a regular expression, if its subparsers can """
+        return False
+
+    def patternCore(self, white:str, leaves:list[str]) -> str:
+        """
+        A regular expression matching what this combinator would, skipping whitespace with the white pattern. The name
+        of each group capturing a leaf is added to leaves, in order.
+        """
+        return self.pattern(white, leaves)
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        """ The combinator specific pattern (see patternCore) """
+        raise NotImplementedError(f'{type(self).__name__} has no pattern')
+
+    def analyze(self, memoize:bool = False, memoSize:int|None = MEMO_SIZE) -> None:
+        super().analyze(memoize, memoSize)
         analyzed:set[Combinator] = set()
         parsers:list[Combinator] = [self]
 
         while parsers:
             parser = parsers.pop()
 
+            if parser.frozen:
+                # Frozen subgrammars were analyzed when they were frozen, and can't be changed
+                continue
+
             if hasattr(parser, 'subparsers'):
                 subparsers = tuple(sub.simplify() for sub in getattr(parser, 'subparsers'))
                 setattr(parser, 'subparsers', subparsers)
@@ -74,6 +174,504 @@ class Combinator(Parser, ABC):
                     parsers.append(subparser)
                     analyzed.add(subparser)
 
+        parsers = reachable(self, frozen=False)
+        markNullable(parsers)
+        markFirst(parsers)
+        markRecursionHeads(parsers)
+        self.fused = fuse(self, parsers)
+
+        for parser in reachable(self, frozen=False):
+            parser.prepare()
+
+    def freeze(self) -> 'Combinator':
+        """
+        An analyzed copy of the grammar that can't be changed, and so can parse from any number of threads at once.
+        Nothing in it is shared with the grammar - not even literals - and everything a parse changes is in its state.
+        Frozen parsers raise a TypeError if anything tries to change them; they can still be used in new grammars.
+        """
+        parsers = connected(self)
+        copies:dict[int, Combinator] = {}
+
+        for parser in parsers:
+            copied = object.__new__(type(parser))
+            copied.__dict__.update(parser.__dict__)
+            # Frozen subgrammars are copied too, and only frozen again once the copy has been analyzed
+            copied.__dict__.pop('frozen', None)
+            copies[id(parser)] = copied
+
+        for copied in copies.values():
+            for name, value in copied.__dict__.items():
+                copied.__dict__[name] = rewire(value, copies)
+
+        frozen = copies[id(self)]
+        frozen.analyze(self.memoize, self.memoSize)
+
+        for parser in connected(frozen):
+            parser.frozen = True
+
+        return frozen
+
+    def parseMany(self,
+            texts:Iterable[Source],
+            workers:int|None = None,
+            chunksize:int = 16,
+            whitespace:str|None = None,
+            ) -> Iterator[Any]:
+        """
+        Parse many strings in a pool of worker processes, yielding for each, in order, what would be the state's
+        tree, or the ParseError if it fails. The grammar is sent to each worker once, when it starts, and the strings
+        chunksize at a time. Only a few chunks per worker are read ahead of what's been yielded, so texts may be a
+        long running iterator.
+
+        When worker processes aren't forked, the grammar is pickled, so its emitters need to be too - functions defined
+        at the top level of a module, rather than lambdas. So do whatever they make.
+        """
+        parsers = reachable(self)
+        workers = workers or os.cpu_count() or 1
+        iterator = iter(texts)
+        batches = iter(lambda: list(islice(iterator, chunksize)), [])
+        pool = ProcessPoolExecutor(workers, initializer=startWorker, initargs=(self, whitespace))
+        pending:deque[Future] = deque()
+
+        try:
+            pending.extend(pool.submit(parseBatch, batch) for batch in islice(batches, 2*workers))
+
+            while pending:
+                results = pending.popleft().result()
+                pending.extend(pool.submit(parseBatch, batch) for batch in islice(batches, 1))
+
+                for result in results:
+                    yield receiveError(result, parsers) if isinstance(result, ParseError) else result
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def parseSplit(self, #pylint: disable=too-many-arguments
+            path:str,
+            boundary:'Boundary',
+            workers:int|None = None,
+            pieces:int|None = None,
+            whitespace:str|None = None,
+            ) -> Iterator[Any]:
+        """
+        Parse a large file in a pool of worker processes, yielding what would be the state's tree a value at a time,
+        in order. The file is split into pieces (by default, four per worker) at the ends of matches of the boundary:
+        a regular expression, or a parser. Each piece is parsed by the grammar on its own, and has to be parsed to its
+        end, so the boundary should only match where an item of the grammar can end. The grammar has to be a
+        repetition with no emitter and no maximum, or it raises a TypeError. If its items have a separator, every piece
+        after the first starts with one, which is yielded before its items.
+
+        The file is parsed as bytes. Each worker maps it into memory itself, and is only sent where its pieces are. If
+        a piece fails, its error is raised, with the line and character it occurred at in the whole file, once all the
+        values before it have been yielded.
+        """
+        if not isinstance(self, Repeat) or self.emit or self.maximum != inf:
+            # Each piece is parsed as a repetition of its own, so nothing can depend on the items of the others
+            raise TypeError('parseSplit needs a grammar that repeats with no emitter and no maximum, like item[0, inf]')
+
+        parsers = reachable(self)
+        workers = workers or os.cpu_count() or 1
+
+        if not os.path.getsize(path):
+            yield from self.iterparse(b'', whitespace)
+            return
+
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            points = splitPoints(source, boundary, pieces or 4*workers)
+            positions = linesAt(source, points)
+
+        pool = ProcessPoolExecutor(workers, initializer=startSplitWorker, initargs=(self, whitespace, path))
+
+        try:
+            pending = [
+                pool.submit(parsePiece, start, end, *position)
+                for start, end, position in zip(points, points[1:], positions)]
+
+            for future in pending:
+                result = future.result()
+
+                if isinstance(result, ParseError):
+                    raise receiveError(result, parsers)
+
+                yield from result
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+_worker:dict[str, Any] = {}
+""" The grammar a pool worker process parses with """
+
+
+def startWorker(grammar:Combinator, whitespace:str|None) -> None:
+    """
+    Set up a worker process of Combinator.parseMany.
+    """
+    _worker['grammar'] = grammar
+    _worker['whitespace'] = whitespace
+    _worker['parsers'] = {id(parser): index for index, parser in enumerate(reachable(grammar))}
+
+
+def parseBatch(texts:list[Source]) -> list[Any]:
+    """
+    Parse a chunk of strings in a worker process of Combinator.parseMany.
+    """
+    grammar = _worker['grammar']
+    results:list[Any] = []
+
+    for text in texts:
+        try:
+            results.append(grammar(text, _worker['whitespace']).tree)
+        except ParseError as error:
+            results.append(sendError(error))
+
+    return results
+
+
+def startSplitWorker(grammar:Combinator, whitespace:str|None, path:str) -> None:
+    """
+    Set up a worker process of Combinator.parseSplit, with the file mapped into memory.
+    """
+    startWorker(grammar, whitespace)
+    # The pieces after the first carry on a repetition, so start with the separator before their first item
+    _worker['rest'] = grammar if not isinstance(grammar, Repeat) or grammar.separator is None \
+        else Seq(grammar.separator, grammar.subparser[1, inf, grammar.separator])
+    with open(path, 'rb') as file:
+        _worker['source'] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def parsePiece(start:int, end:int, line:int, char:int) -> Any:
+    """
+    Parse a piece of the file in a worker process of Combinator.parseSplit, which starts at the given line and
+    character. The whole piece has to parse.
+    """
+    grammar = _worker['rest'] if start else _worker['grammar']
+    text = memoryview(_worker['source'])[start:end]
+
+    def startPiece(**options:Any) -> State:
+        state = grammar.start(text, _worker['whitespace'], PieceState, lines=LineIndex(text, line, char), **options)
+        state.base = start
+        return state
+
+    try:
+        state = grammar.run(startPiece())
+
+        if not state.eof:
+            # Find why the parse stopped short, without fused patterns
+            state = startPiece(fuse=False, build=False)
+            grammar.parseCore(state)
+            raise state.error()
+
+        return state.tree
+    except ParseError as error:
+        return sendError(error.trim())
+
+
+class PieceState(State):
+    """
+    A state parsing a piece of a file in a worker process of Combinator.parseSplit. The piece is a view of the file
+    mapped into memory, rather than a copy of it, but its leaves are copied out as bytes, as they would be if the file
+    were parsed whole, so they can be sent back.
+    """
+    def consume(self, length:int) -> None:
+        leaves = len(self._tree[-1])
+        super().consume(length)
+        self.copyLeaves(leaves)
+
+    def consumeMatch(self, matched:re.Match, groups:tuple[int, ...]) -> None:
+        leaves = len(self._tree[-1])
+        super().consumeMatch(matched, groups)
+        self.copyLeaves(leaves)
+
+    def copyLeaves(self, leaves:int) -> None:
+        """ Copy the leaves added to the current branch since it had the given number of them """
+        branch = self._tree[-1]
+        branch[leaves:] = [bytes(leaf) for leaf in branch[leaves:]]
+
+
+def sendError(error:ParseError) -> ParseError:
+    """
+    Get the error from a worker process ready to send back. The failed parser is sent as its place in the grammar,
+    rather than a copy of it.
+    """
+    if id(error.parser) in _worker['parsers']:
+        error.parser = _worker['parsers'][id(error.parser)] #type: ignore[assignment]
+    return error
+
+
+def receiveError(error:ParseError, parsers:list['Combinator']) -> ParseError:
+    """
+    Restore the failed parser of an error sent back by a worker process.
+    """
+    if isinstance(error.parser, int):
+        error.parser = parsers[error.parser]
+    return error
+
+
+def splitPoints(source:mmap.mmap, boundary:'Boundary', pieces:int) -> list[int]:
+    """
+    Offsets to split the source into about as many pieces, of about the same size, each ending at the end of a match
+    of the boundary.
+    """
+    if isinstance(boundary, Combinator):
+        state = boundary.start(source, '', build=False)
+    else:
+        pattern = re.compile(boundary.encode() if isinstance(boundary, str) else boundary)
+
+    points = [0]
+
+    for piece in range(1, pieces):
+        pos = max(len(source) * piece // pieces, points[-1] + 1)
+        end:int|None = None
+
+        if isinstance(boundary, Combinator):
+            while end is None and pos < len(source):
+                state.pos = pos
+                matched = boundary.parseCore(state)
+                end = None if matched is None else matched.pos
+                pos += 1
+        else:
+            found = pattern.search(source, pos)
+            end = None if found is None else found.end()
+
+        if end is None or end >= len(source):
+            break
+
+        points.append(end)
+
+    points.append(len(source))
+    return points
+
+
+def linesAt(source:mmap.mmap, points:list[int]) -> list[tuple[int, int]]:
+    """
+    The line and character each of the offsets into the source is at.
+    """
+    positions:list[tuple[int, int]] = []
+    line = 1
+    counted = 0
+
+    for point in points:
+        for window in range(counted, point, CHUNK_SIZE*256):
+            line += source[window:min(window + CHUNK_SIZE*256, point)].count(b'\n')
+        counted = point
+        positions.append((line, point - source.rfind(b'\n', 0, point)))
+
+    return positions
+
+
+def connected(root:Combinator) -> list[Combinator]:
+    """
+    Every combinator a grammar holds on to: the reachable ones, and any others in its lookup tables or replaced by
+    fused patterns.
+    """
+    found:dict[int, Combinator] = {}
+    values:list[Any] = [root]
+
+    while values:
+        value = values.pop()
+
+        if isinstance(value, Combinator):
+            if id(value) not in found:
+                found[id(value)] = value
+                values.extend(value.__dict__.values())
+        elif isinstance(value, (tuple, list)):
+            values.extend(value)
+        elif isinstance(value, dict):
+            values.extend(value.values())
+        elif isinstance(value, MethodType):
+            values.append(value.__self__)
+
+    return list(found.values())
+
+
+def rewire(value:Any, copies:dict[int, Combinator]) -> Any:
+    """
+    An attribute of a copied combinator, pointing at the copies of any combinators it held.
+    """
+    if isinstance(value, Combinator):
+        return copies.get(id(value), value)
+    if isinstance(value, tuple):
+        return tuple(rewire(item, copies) for item in value)
+    if isinstance(value, list):
+        return [rewire(item, copies) for item in value]
+    if isinstance(value, dict):
+        return {key: rewire(item, copies) for key, item in value.items()}
+    if isinstance(value, MethodType) and id(value.__self__) in copies:
+        return MethodType(value.__func__, copies[id(value.__self__)])
+    return value
+
+
+def reachable(root:Combinator, frozen:bool = True) -> list[Combinator]:
+    """
+    Every combinator in a grammar, in depth-first order. If frozen is False, frozen subgrammars are left out.
+    """
+    found:dict[int, Combinator] = {}
+    parsers = [root]
+
+    while parsers:
+        parser = parsers.pop()
+
+        if id(parser) not in found and (frozen or not parser.frozen):
+            found[id(parser)] = parser
+            parsers.extend(reversed(parser.children()))
+
+    return list(found.values())
+
+
+def markNullable(parsers:list[Combinator]) -> None:
+    """
+    Find which combinators can succeed without consuming any input.
+    """
+    for parser in parsers:
+        parser.nullable = False
+
+    changed = True
+    while changed:
+        changed = False
+
+        for parser in parsers:
+            if not parser.nullable and parser.isNullable():
+                parser.nullable = True
+                changed = True
+
+
+def markFirst(parsers:list[Combinator]) -> None:
+    """
+    Find the characters each combinator's matches can start with.
+    """
+    for parser in parsers:
+        parser.first = frozenset()
+
+    changed = True
+    while changed:
+        changed = False
+
+        for parser in parsers:
+            if parser.first is not None:
+                first = parser.firstSet()
+                if first != parser.first:
+                    parser.first = first
+                    changed = True
+
+
+def components(
+        parsers:Iterable[Combinator],
+        edges:Callable[[Combinator], Iterable[Combinator]]
+        ) -> list[list[Combinator]]:
+    """
+    The strongly connected components of a grammar graph (Tarjan's algorithm).
+    """
+    members = {id(parser): parser for parser in parsers}
+    index:dict[int, int] = {}
+    low:dict[int, int] = {}
+    stack:list[Combinator] = []
+    stacked:dict[int, int] = {}
+    found:list[list[Combinator]] = []
+
+    def enter(parser:Combinator) -> tuple[Combinator, Iterator[Combinator]]:
+        index[id(parser)] = low[id(parser)] = len(index)
+        stacked[id(parser)] = len(stack)
+        stack.append(parser)
+        return parser, iter([child for child in edges(parser) if id(child) in members])
+
+    for root in members.values():
+        if id(root) in index:
+            continue
+
+        work = [enter(root)]
+
+        while work:
+            parser, children = work[-1]
+            child = next(children, None)
+
+            if child is None:
+                work.pop()
+                if work:
+                    low[id(work[-1][0])] = min(low[id(work[-1][0])], low[id(parser)])
+
+                if low[id(parser)] == index[id(parser)]:
+                    found.append(stack[stacked[id(parser)]:])
+                    del stack[stacked[id(parser)]:]
+                    for member in found[-1]:
+                        del stacked[id(member)]
+
+            elif id(child) not in index:
+                work.append(enter(child))
+
+            elif id(child) in stacked:
+                low[id(parser)] = min(low[id(parser)], index[id(child)])
+
+    return found
+
+
+def markRecursionHeads(parsers:list[Combinator]) -> None:
+    """
+    Find the parsers that memoized parses should grow left-recursive matches from. Every cycle of parsers that can call
+    each other without consuming input gets a head; the other parsers in the cycle can't be memoized, since their
+    outcome depends on how far the head has grown.
+    """
+    for parser in parsers:
+        parser.memoizable = type(parser).compound
+        parser.recursionHead = False
+
+    remaining = parsers
+
+    while remaining:
+        cycles = [
+            component
+            for component in components(remaining, lambda parser: parser.leftChildren())
+            if len(component) > 1 or component[0] in component[0].leftChildren()
+            ]
+        heads = set()
+
+        for cycle in cycles:
+            members = set(map(id, cycle))
+            # Prefer alternatives as heads - an expression rule is usually a choice between its left-recursive forms
+            head = min(
+                (parser for parser in remaining if id(parser) in members),
+                key=lambda parser: not isinstance(parser, Choice))
+            head.recursionHead = True
+            heads.add(id(head))
+
+            for parser in cycle:
+                parser.memoizable = parser is head
+
+        remaining = [
+            parser
+            for cycle in cycles
+            for parser in cycle
+            if id(parser) not in heads
+            ]
+
+
+def fuse(root:Combinator, parsers:list[Combinator]) -> bool:
+    """
+    Replace each largest subgrammar that's regular - no recursion, emitters or unbounded repeats - with a single
+    compiled pattern. Returns True if anything was fused.
+    """
+    regular:set[int] = set()
+
+    # Components come out with every parser after all of its subparsers
+    for component in components(parsers, lambda parser: parser.children()):
+        parser = component[0]
+
+        if len(component) == 1 and not parser.emit and parser.isRegular() \
+                and all(id(child) in regular for child in parser.children()):
+            regular.add(id(parser))
+
+    replacements:dict[int, Combinator] = {}
+
+    for parser in parsers:
+        if id(parser) in regular and parser is not root:
+            continue
+
+        for child in parser.children():
+            if id(child) in regular and child.children() and id(child) not in replacements:
+                replacements[id(child)] = Fused(child)
+
+        parser.replaceChildren(replacements)
+
+    return bool(replacements)
+
 
 class Lit(Combinator):
     """
@@ -95,18 +693,56 @@ class Lit(Combinator):
     def __init__(self, string:str) -> None:
         super().__init__()
         self.string = string
+        self._encoded = string.encode()
         self._hash = hash(string)
 
+    def __reduce__(self) -> tuple:
+        # Plain literals unpickle as the interned one; named, emitting or frozen ones as copies of their own
+        intern = self.name is None and self.emit is None and not self.frozen
+        return (unpickleLit, (self.string, intern), self.__dict__)
+
+    def __setstate__(self, state:dict[str, Any]) -> None:
+        # A literal that was already interned keeps its own state
+        if not self.__dict__:
+            self.__dict__.update(state)
+
     def expect(self, state:Expect) -> List[str]:
         return [self.string]
 
+    def isNullable(self) -> bool:
+        return not self.string
+
+    def firstSet(self) -> frozenset[str]|None:
+        return frozenset(self.string[0:1])
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        return leafPattern(re.escape(self.string), white, leaves)
+
     def recognize(self, state:State) -> Optional[State]:
-        if not state.text.startswith(self.string):
+        if state.binary:
+            return self.recognizeBytes(state)
+
+        if not state.source.startswith(self.string, state.pos):
+            state.fail(self, state.pos)
             return None
 
         state.consume(len(self.string))
         return state
 
+    def recognizeBytes(self, state:State) -> Optional[State]:
+        """ Recognize the string's UTF-8 encoding """
+        end = state.pos + len(self._encoded)
+
+        if state.source[state.pos:end] != self._encoded:
+            state.fail(self, state.pos)
+            return None
+
+        state.consume(len(self._encoded))
+        return state
+
     def __hash__(self) -> int:
         return self._hash
 
@@ -114,6 +750,20 @@ class Lit(Combinator):
         return f'Lit({self.string})'
 
 
+def unpickleLit(string:str, intern:bool) -> Lit:
+    """
+    The literal a pickled one unpickles as: the interned one, if it should be and there is one, or an empty one to
+    unpickle its state into.
+    """
+    if intern and string in Lit.instances:
+        return Lit.instances[string]
+
+    lit = object.__new__(Lit)
+    if intern:
+        Lit.instances[string] = lit
+    return lit
+
+
 def asCombinator(arg:Parseable) -> Combinator:
     """
     Ensure a value is a Combinator
@@ -151,33 +801,51 @@ class Seq(Combinator):
     def expect(self, state:Expect) -> List[str]:
         return self.subparsers[0].expectCore(state)
 
+    def children(self) -> tuple[Combinator, ...]:
+        return self.subparsers
+
+    def leftChildren(self) -> tuple[Combinator, ...]:
+        for index, parser in enumerate(self.subparsers):
+            if not parser.nullable:
+                return self.subparsers[:index + 1]
+        return self.subparsers
+
+    def isNullable(self) -> bool:
+        return all(parser.nullable for parser in self.subparsers)
+
+    def replaceChildren(self, replacements:dict[int, Combinator]) -> None:
+        self.subparsers = tuple(replacements.get(id(parser), parser) for parser in self.subparsers)
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        return ''.join(parser.patternCore(white, leaves) for parser in self.subparsers)
+
     def recognize(self, state:State) -> State|None:
         first = True
         for parser in self.subparsers:
             if not first:
                 state.shiftParser()
 
-            if parser.compound:
-                try:
-                    state = parser.parseCore(state)
-                finally:
-                    if not first:
-                        state.unshiftParser()
-            else:
-                newState = parser.recognize(state)
-                if not first:
-                    state.unshiftParser()
+            newState = parser.parseCore(state) if parser.compound else parser.recognize(state)
 
-                if newState is None:
-                    return None
+            if not first:
+                state.unshiftParser()
 
-                state = newState
+            if newState is None:
+                return None
 
+            state = newState
             first = False
 
         return state
 
     def __add__(self, right:Parseable) -> Parseable:
+        if self.frozen:
+            # A frozen sequence can't grow, but it can start a new one
+            return Seq(self, right)
+
         subparsers = list(self.subparsers)
         subparsers.append(asCombinator(right))
         self.subparsers = tuple(subparsers)
@@ -213,6 +881,10 @@ class Choice(Combinator):
                 self.subparsers = (asCombinator(right), )
 
         self._hash:int = hash(self.subparsers)
+        self._dispatch:dict[str, tuple[Combinator, ...]]|None = None
+        # The same, by the first byte of each character's UTF-8 encoding, or -1 for the end of input
+        self._byteDispatch:dict[int, tuple[Combinator, ...]] = {}
+        self._otherwise:tuple[Combinator, ...] = ()
 
     def expect(self, state:Expect) -> List[str]:
         return \
@@ -221,35 +893,89 @@ class Choice(Combinator):
               for string in subparser.expectCore(state)
             ]
 
+    def children(self) -> tuple[Combinator, ...]:
+        return self.subparsers
+
+    def isNullable(self) -> bool:
+        return any(parser.nullable for parser in self.subparsers)
+
+    def replaceChildren(self, replacements:dict[int, Combinator]) -> None:
+        self.subparsers = tuple(replacements.get(id(parser), parser) for parser in self.subparsers)
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        return atomic('|'.join(parser.patternCore(white, leaves) for parser in self.subparsers))
+
+    def prepare(self) -> None:
+        """
+        Build a table of the alternatives worth trying for each next character, in order.
+        """
+        chars = set().union(*(parser.first for parser in self.subparsers if parser.first is not None))
+        anything = tuple(parser for parser in self.subparsers if parser.nullable or parser.first is None)
+
+        self._dispatch = {
+            char: tuple(
+                parser
+                for parser in self.subparsers
+                if parser.nullable or parser.first is None or char in parser.first)
+            for char in chars
+            }
+        # The end of input
+        self._dispatch[''] = tuple(parser for parser in self.subparsers if parser.nullable)
+        self._otherwise = anything
+
+        initials = {
+            id(parser): frozenset(char.encode()[0] for char in parser.first)
+            for parser in self.subparsers
+            if parser.first is not None
+            }
+        self._byteDispatch = {
+            byte: tuple(
+                parser
+                for parser in self.subparsers
+                if parser.nullable or parser.first is None or byte in initials[id(parser)])
+            for byte in frozenset().union(*initials.values())
+            }
+        self._byteDispatch[-1] = self._dispatch['']
+
     def recognize(self, state:State) -> State|None:
-        bestState:State|None = None
-        
-        for parser in self.subparsers:
-            if not state.inRecursion(parser):
-                trialState:State|None
-
-                if parser.compound:
-                    trialState = state.pushState()
-
-                    try:
-                        trialState = parser.parseCore(trialState)
-                    except ParseError:
-                        continue
-                else:
-                    trialState = parser.recognize(state)
-
-                if trialState is not None:
-                    if state != trialState:
-                        state = trialState.popState()
-                    bestState = state
-                    break
-        return bestState
+        if self._dispatch is None:
+            candidates = self.subparsers
+        elif state.binary:
+            candidates = self._byteDispatch.get(
+                state.source[state.pos] if state.pos < len(state.source) else -1,
+                self._otherwise)
+        else:
+            candidates = self._dispatch.get(state.source[state.pos:state.pos + 1], self._otherwise)
+
+        for parser in candidates:
+            if state.inRecursion(parser):
+                continue
+
+            if not parser.compound:
+                if parser.recognize(state) is not None:
+                    return state
+                continue
+
+            mark = state.mark()
+            if parser.parseCore(state) is not None:
+                state.commit()
+                return state
+            state.rollback(mark)
+
+        return None
 
     def __or__(self, right:Parseable) -> Parseable:
+        if self.frozen:
+            return Choice(self, right)
+
         subparsers = list(self.subparsers)
         subparsers.append(asCombinator(right))
         self.subparsers = tuple(subparsers)
         self._hash = hash(self.subparsers)
+        self._dispatch = None
         return self
 
     def __hash__(self) -> int:
@@ -278,6 +1004,12 @@ class Repeat(Combinator):
         self.separator = None if separator is None else asCombinator(separator)
         self._hash = hash(hash(self.subparser)+hash(self.minimum)+hash(self.maximum))
 
+        self._sepParse:Callable[[State], State|None]|None
+        self._subParse:Callable[[State], State|None]
+        self.bindParsers()
+
+    def bindParsers(self) -> None:
+        """ Pick how to run the subparser and separator """
         self._sepParse = None if self.separator is None \
             else self.sepParse if self.separator.compound \
             else self.sepRecognize
@@ -288,12 +1020,51 @@ class Repeat(Combinator):
     def expect(self, state:Expect) -> List[str]:
         return self.subparser.expectCore(state)
 
+    def children(self) -> tuple[Combinator, ...]:
+        if self.separator is None:
+            return (self.subparser, )
+        return (self.subparser, self.separator)
+
+    def leftChildren(self) -> tuple[Combinator, ...]:
+        if self.subparser.nullable:
+            return self.children()
+        return (self.subparser, )
+
+    def isNullable(self) -> bool:
+        return self.minimum == 0 or self.subparser.nullable \
+            and (self.minimum == 1 or self.separator is None or self.separator.nullable)
+
+    def replaceChildren(self, replacements:dict[int, Combinator]) -> None:
+        self.subparser = replacements.get(id(self.subparser), self.subparser)
+        if self.separator is not None:
+            self.separator = replacements.get(id(self.separator), self.separator)
+        self.bindParsers()
+
+    def isRegular(self) -> bool:
+        # An item that matches nothing would repeat differently
+        return not self.subparser.nullable \
+            and (self.minimum if self.maximum is None else self.maximum) <= UNROLL_LIMIT
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        def item(parsed:int) -> str:
+            if parsed > 0 and self.separator is not None:
+                return self.separator.patternCore(white, leaves) + self.subparser.patternCore(white, leaves)
+            return self.subparser.patternCore(white, leaves)
+
+        pattern = ''.join(item(parsed) for parsed in range(self.minimum))
+        optional = range(self.minimum, cast(int, self.maximum if self.maximum is not None else self.minimum))
+        # Each optional item is only tried if the one before it matched
+        items = [item(parsed) for parsed in optional]
+        tail = ''
+
+        for optionalItem in reversed(items):
+            tail = atomic(f'(?:{optionalItem}{tail})?')
+
+        return pattern + tail
+
     def sepParse(self, state:State) -> State|None:
         """ Parse seperator with parseCore """
-        try:
-            return cast(Combinator, self.separator).parseCore(state)
-        except ParseError:
-            return None
+        return cast(Combinator, self.separator).parseCore(state)
 
     def sepRecognize(self, state:State) -> State|None:
         """ Parse separator with recognize """
@@ -301,10 +1072,7 @@ class Repeat(Combinator):
 
     def subParse(self, state:State) -> State|None:
         """ Parse subparser with parseCore """
-        try:
-            return self.subparser.parseCore(state)
-        except ParseError:
-            return None
+        return self.subparser.parseCore(state)
 
     def subRecognize(self, state:State) -> State|None:
         """ Parse subparser with recognize """
@@ -335,25 +1103,71 @@ class Repeat(Combinator):
 
         if self.maximum is not None:
             while parsed < self.maximum:
-                mustPop = self.subparser.compound or self.separator and self.separator.compound
-                if mustPop:
-                    trialState = state.pushState()
-                else:
-                    trialState = state
+                start = state.pos
+                # A separator is only kept if the item after it matches too
+                mark = state.mark()
 
-                newState = self.recognizeOne(trialState, parsed)
+                if self.recognizeOne(state, parsed) is None:
+                    state.rollback(mark)
+                    break
+
+                state.commit()
+                parsed += 1
 
-                if newState is None:
+                # An item that matched nothing would match nothing forever
+                if state.pos == start:
                     break
 
-                state = newState
+        return state
 
-                if mustPop:
-                    state = state.popState()
+    def items(self, state:State) -> Iterator[State]:
+        if self.emit:
+            # The items are only finished once they've all been passed to the emitter
+            yield from super().items(state)
+            return
 
-                parsed += 1
+        maximum = self.minimum if self.maximum is None else self.maximum
+        parsed = 0
 
-        return state
+        if not self.recurse:
+            state.pushParser(self)
+
+        while parsed < maximum:
+            start = state.pos
+            mark = state.mark()
+
+            with deepRecursion:
+                matched = self.recognizeOne(state, parsed)
+
+            if matched is None:
+                state.rollback(mark)
+
+                if parsed >= self.minimum:
+                    break
+
+                if self.fused and state.fuse:
+                    # Fused patterns can't tell how far into them a parse got, so find the error without them
+                    state.fuse = False
+                    with deepRecursion:
+                        self.recognizeOne(state, parsed)
+                if not parsed:
+                    state.fail(self, state.pos)
+                raise state.error()
+
+            state.commit()
+            parsed += 1
+            # An item that matched nothing would match nothing forever
+            stuck = state.pos == start
+            yield state
+
+            if stuck:
+                break
+
+        if not self.recurse:
+            state.popParser(self)
+
+        if not parsed:
+            yield state
 
     def __hash__(self) -> int:
         return self._hash
@@ -375,6 +1189,21 @@ class Id(Combinator):
     def expect(self, state:Expect) -> List[str]:
         return self.subparser.expectCore(state)
 
+    def children(self) -> tuple[Combinator, ...]:
+        return (self.subparser, )
+
+    def isNullable(self) -> bool:
+        return self.subparser.nullable
+
+    def replaceChildren(self, replacements:dict[int, Combinator]) -> None:
+        self.subparser = replacements.get(id(self.subparser), self.subparser)
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        return self.subparser.patternCore(white, leaves)
+
     def recognize(self, state:State) -> Optional[State]:
         return self.subparser.parseCore(state)
 
@@ -395,6 +1224,18 @@ class CClass(Combinator):
     def expect(self, state:Expect) -> List[str]:
         return []
 
+    def isNullable(self) -> bool:
+        return True
+
+    def firstSet(self) -> frozenset[str]|None:
+        return frozenset()
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        return ''
+
     def recognize(self, state:State) -> Optional[State]:
         return state
 
@@ -407,3 +1248,80 @@ class CClass(Combinator):
 
 
 C = CClass()
+
+
+class Fused(Combinator):
+    """
+    A regular subgrammar, compiled into a single pattern by analyze. It parses the same leaves the subgrammar would.
+    """
+    recurse = True # There's no recursion in a regular grammar
+
+    def __init__(self, original:Combinator) -> None:
+        super().__init__()
+        self.original = original
+        """ The subgrammar this stands in for """
+        self.nullable = original.nullable
+        self.first = original.first
+        self.memoizable = False
+        # The compiled pattern and its leaf groups, by whitespace
+        self._patterns:dict[str|None, tuple[re.Pattern, tuple[int, ...]]] = {}
+        self._bytePatterns:dict[str|None, tuple[re.Pattern, tuple[int, ...]]] = {}
+
+    def expect(self, state:Expect) -> List[str]:
+        return self.original.expectCore(state)
+
+    def isNullable(self) -> bool:
+        return self.original.nullable
+
+    def firstSet(self) -> frozenset[str]|None:
+        return self.original.first
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        return self.original.patternCore(white, leaves)
+
+    def compile(self, whitespace:str|None, binary:bool = False) -> tuple[re.Pattern, tuple[int, ...]]:
+        """
+        The pattern for parsing with the given whitespace, and the numbers of its leaf groups. If binary is True, the
+        pattern matches bytes.
+        """
+        patterns = self._bytePatterns if binary else self._patterns
+
+        if whitespace not in patterns:
+            leaves:list[str] = []
+            source = self.original.patternCore(whitePattern(whitespace), leaves)
+            pattern = re.compile(source.encode() if binary else source)
+            patterns[whitespace] = (pattern, tuple(pattern.groupindex[leaf] for leaf in leaves))
+
+        return patterns[whitespace]
+
+    def recognize(self, state:State) -> Optional[State]:
+        if not state.fuse:
+            # Callers don't mark around a non-compound parser, so undo a partial parse of the original here
+            mark = state.mark()
+            if self.original.parseCore(state) is None:
+                state.rollback(mark)
+                return None
+            state.commit()
+            return state
+
+        if state.binary:
+            pattern, groups = self._bytePatterns.get(state.whitespace) or self.compile(state.whitespace, True)
+        else:
+            pattern, groups = self._patterns.get(state.whitespace) or self.compile(state.whitespace)
+        matched = pattern.match(state.source, state.pos)
+        # A match that runs to the end of a stream's buffer may carry on past it
+        while matched and matched.end() == len(state.source) and state.more():
+            matched = pattern.match(state.source, state.pos)
+
+        if matched is None:
+            state.fail(self, state.pos)
+            return None
+
+        state.consumeMatch(matched, groups)
+        return state
+
+    def repr(self) -> str:
+        return f'Fused({self.original})'
@@ -0,0 +1,581 @@
+"""
+Compiles grammars into specialized Python parsers.
+"""
+from typing import Any, Callable
+import builtins
+import re
+from math import inf
+from .parser import State, ParseError, EndOfInputError, Emitter
+from .combinator import Combinator, Lit, Seq, Choice, Repeat, Id, CClass, Fused, components
+from .extras import cs, rs, defer
+
+MAX_INDENT = 24
+""" Parsers nested deeper than this many indents in a generated function get a function of their own """
+MAX_LOOPS = 8
+""" Repeats nested deeper than this many loops in a generated function get a function of their own """
+
+WHITE = '(?#white)'
+""" Placeholder for the whitespace pattern in fused pattern templates """
+
+_HEADER = '''"""
+Parser generated by comber.
+"""
+import re
+
+WHITESPACE = {whitespace!r}
+""" Default whitespace """
+
+_EXPECTED = {expected!r}
+
+
+class ParseError(Exception):
+    """
+    When a string cannot be parsed, this exception is thrown.
+    """
+    def __init__(self, source, offset, expected):
+        super().__init__('Unexpected text')
+        self.source = source
+        """ The complete input text. """
+        self.offset = offset
+        """ The offset into the input text the error occurred at. """
+        self.expected = list(set(expected))
+        """ The possible next tokens """
+
+    @property
+    def line(self):
+        """ The input line the error occurred at. """
+        return self.source.count('\\n', 0, self.offset) + 1
+
+    @property
+    def char(self):
+        """ The character offset into the line the error occurred at. """
+        return self.offset - self.source.rfind('\\n', 0, self.offset)
+
+    @property
+    def text(self):
+        """ The unparsed input text. """
+        return self.source[self.offset:]
+
+    @property
+    def message(self):
+        """ A lazy version of the exception message. """
+        return str(self.line)+":"+str(self.char)+": " \\
+            +'Unexpected text: ' \\
+            +self.source[self.offset:self.offset + 10] \\
+            +'. Expected one of: ' \\
+            +', '.join(self.expected)
+
+    def __str__(self):
+        return self.message
+
+
+class EndOfInputError(ParseError):
+    """
+    When we reach the end of input before completing a full parse.
+    """
+
+    @property
+    def message(self):
+        return 'Unexpected end of input. Expected one of: ' \\
+            +', '.join(self.expected)
+
+
+class Parsed:
+    """
+    The outcome of a parse.
+    """
+    def __init__(self, source, pos, tree):
+        self.source = source
+        """ The complete input text """
+        self.pos = pos
+        """ Offset of the unparsed input into the source """
+        self.tree = tree
+        """ The parse tree """
+
+    @property
+    def text(self):
+        """ Unparsed input """
+        return self.source[self.pos:]
+
+    @property
+    def eof(self):
+        """ True if the whole input was parsed """
+        return self.pos >= len(self.source)
+
+    @property
+    def result(self):
+        """ The parser result """
+        return self.tree[0]
+
+
+def _error(source, offset, index):
+    if offset >= len(source):
+        return EndOfInputError(source, offset, _EXPECTED[index])
+    return ParseError(source, offset, _EXPECTED[index])
+
+
+def _failed(fail, pos, index):
+    if pos >= fail[0]:
+        fail[0] = pos
+        fail[1] = index
+    return -1
+
+
+def _fused(template, leaves, white):
+    pattern = re.compile(template.replace({placeholder!r}, white))
+    return pattern.match, tuple(pattern.groupindex[leaf] for leaf in leaves)
+'''
+
+_FOOTER = '''
+
+_grammars = {{}}
+
+
+def parse(text, whitespace=None):
+    """
+    Parse a string.
+    """
+    whitespace = whitespace if whitespace is not None else WHITESPACE
+    if whitespace not in _grammars:
+        _grammars[whitespace] = _build(whitespace)
+    root, skip = _grammars[whitespace]
+
+    fail = [-1, 0]
+    tree = []
+    pos = root(text, skip(text, 0).end(), tree, fail{frames})
+
+    if pos < 0:
+        raise _error(text, fail[0], fail[1])
+
+    return Parsed(text, pos, tree)
+'''
+
+
+def resolve(parser:Combinator) -> Combinator:
+    """
+    The parser a defer stands in for, or the parser itself.
+    """
+    while isinstance(parser, defer):
+        parser = parser.subparser
+    return parser
+
+
+def isLeaf(parser:Combinator) -> bool:
+    """
+    Whether a parser produces at most a single leaf, and leaves the tree alone if it fails.
+    """
+    return isinstance(parser, (Lit, cs, rs, CClass)) and not parser.emit
+
+
+def children(parser:Combinator) -> tuple[Combinator, ...]:
+    """
+    The subparsers of a parser, with defers resolved.
+    """
+    return tuple(resolve(child) for child in parser.children())
+
+
+class Rules:
+    """
+    Which parsers of a grammar get a routine of their own, and which need the recursion guard of unmemoized parses.
+    """
+    def __init__(self, grammar:Combinator) -> None:
+        parsers:dict[int, Combinator] = {}
+        parents:dict[int, int] = {}
+        work = [grammar]
+
+        while work:
+            parser = work.pop()
+            if id(parser) in parsers:
+                continue
+            parsers[id(parser)] = parser
+
+            for child in children(parser):
+                parents[id(child)] = parents.get(id(child), 0) + 1
+                work.append(child)
+
+        routines:set[int] = {id(grammar)}
+        self.guarded:set[int] = set()
+        """ The recursive parsers that check for recursion (see State.inRecursion) """
+
+        for component in components(parsers.values(), children):
+            if len(component) > 1 or any(child is component[0] for child in children(component[0])):
+                routines.update(id(parser) for parser in component)
+                self.guarded.update(id(parser) for parser in component if not parser.recurse)
+
+        for parser in parsers.values():
+            if parser.name or parents.get(id(parser), 0) > 1:
+                routines.add(id(parser))
+
+        self.routines = {key for key in routines if not isLeaf(parsers[key])}
+        """ The named, shared and recursive parsers """
+
+        self.shifted = set(self.guarded)
+        """ The parsers that can reach a guarded parser, so need a new recursion frame after the start of a sequence """
+        changed = True
+        while changed:
+            changed = False
+            for parser in parsers.values():
+                if id(parser) not in self.shifted and any(id(child) in self.shifted for child in children(parser)):
+                    self.shifted.add(id(parser))
+                    changed = True
+
+
+class Generator: #pylint: disable=too-many-instance-attributes
+    """
+    Writes the source of a parser for a grammar: one function per named, shared or recursive rule, with everything
+    else inlined into them.
+    """
+    def __init__(self, grammar:Combinator, standalone:bool = True) -> None:
+        self.grammar = resolve(grammar)
+        self.standalone = standalone
+        """ If True, emitters are imported by name rather than supplied by compile """
+        self.parsers:list[Combinator] = []
+        """ Each parser in the generated code, by its index """
+        self.emitters:dict[int, Emitter] = {}
+        """ Each emitter, by the index of its parser """
+        self._indexes:dict[int, int] = {}
+        self._functions:dict[int, str] = {}
+        self._pending:list[Combinator] = []
+        self._constants:list[str] = []
+        self._lines:list[str] = []
+        self._indent = 1
+        self._loops = 0
+
+        self._rules = Rules(self.grammar)
+        self._args = 'src, pos, out, fail, frames' if self._rules.guarded else 'src, pos, out, fail'
+
+    def index(self, parser:Combinator) -> int:
+        """ The index of a parser in the generated code """
+        if id(parser) not in self._indexes:
+            self._indexes[id(parser)] = len(self.parsers)
+            self.parsers.append(parser)
+            if parser.emit:
+                self.emitters[len(self.parsers) - 1] = parser.emit
+
+        return self._indexes[id(parser)]
+
+    def line(self, text:str) -> None:
+        """ Add a line of code at the current indent """
+        self._lines.append('    ' * self._indent + text)
+
+    def constant(self, name:str, value:str) -> str:
+        """ Define a value once, when the grammar is built for a whitespace """
+        line = f'    {name} = {value}'
+        if line not in self._constants:
+            self._constants.append(line)
+        return name
+
+    def function(self, parser:Combinator) -> str:
+        """ The name of the function parsing with a parser, queuing it to be written """
+        if id(parser) not in self._functions:
+            self._functions[id(parser)] = f'_parse{self.index(parser)}'
+            self._pending.append(parser)
+        return self._functions[id(parser)]
+
+    def source(self) -> str:
+        """ The source of the parser module """
+        root = self.function(self.grammar)
+        functions:list[str] = []
+
+        while self._pending:
+            parser = self._pending.pop(0)
+            self._lines = [f'    def {self._functions[id(parser)]}({self._args}):']
+            self._indent = 2
+            self._loops = 0
+            self.body(parser)
+            self.line('return pos')
+            functions.append('\n'.join(self._lines))
+
+        expected = tuple(list(dict.fromkeys(parser.expectCore())) for parser in self.parsers)
+        source = [
+            _HEADER.format(whitespace=self.grammar.whitespace, expected=expected, placeholder=WHITE),
+            *self.imports(),
+            '',
+            'def _build(whitespace):',
+            "    white = '[' + re.escape(whitespace) + ']*' if whitespace else ''",
+            '    _skip = re.compile(white).match',
+            *self._constants,
+            '',
+            '\n\n'.join(functions),
+            '',
+            f'    return {root}, _skip',
+            _FOOTER.format(frames=', [{}]' if self._rules.guarded else ''),
+            ]
+
+        return '\n'.join(source)
+
+    def imports(self) -> list[str]:
+        """ Code binding each emitter to its name in a standalone parser """
+        if not self.standalone:
+            return []
+
+        lines = []
+
+        for index, emit in self.emitters.items():
+            module = getattr(emit, '__module__', None)
+            qualname = getattr(emit, '__qualname__', '')
+
+            if not module or not qualname or '<' in qualname:
+                raise ValueError(f"Emitter {emit!r} can't be imported by a standalone parser")
+
+            if module == 'builtins':
+                lines.append(f'_emit{index} = {qualname}')
+            else:
+                lines.append(f'import {module}')
+                lines.append(f'_emit{index} = {module}.{qualname}')
+
+        return lines
+
+    def node(self, parser:Combinator) -> None:
+        """
+        Code parsing with a parser from pos, leaving pos at the end of its match, or -1 if it failed.
+        """
+        if not isLeaf(parser) and (
+                id(parser) in self._rules.routines or self._indent > MAX_INDENT or self._loops >= MAX_LOOPS):
+            self.line(f'pos = {self.function(parser)}({self._args})')
+        else:
+            self.body(parser)
+
+    def body(self, parser:Combinator) -> None:
+        """
+        The code of a parser, with its emitter, recursion guard and failure (see Parser.parseFresh).
+        """
+        if isLeaf(parser) or isinstance(parser, Fused):
+            self.recognize(parser)
+            return
+
+        index = self.index(parser)
+        guarded = id(parser) in self._rules.guarded
+
+        self.line(f's{index} = pos')
+        if parser.emit:
+            self.line(f'n{index} = len(out)')
+        if guarded:
+            self.line(f'f{index} = frames[-1]')
+            self.line(f'f{index}[{index}] = f{index}.get({index}, 0) + 1')
+
+        self.recognize(parser)
+
+        if guarded:
+            self.line(f'if f{index}[{index}] > 1:')
+            self.line(f'    f{index}[{index}] -= 1')
+            self.line('else:')
+            self.line(f'    del f{index}[{index}]')
+
+        self.line('if pos < 0:')
+        self.line(f'    pos = _failed(fail, s{index}, {index})')
+        if parser.emit:
+            self.line('else:')
+            self.line(f'    out[n{index}:] = [_emit{index}(*out[n{index}:])]')
+
+    def block(self, condition:str, parser:Combinator) -> None:
+        """ Code parsing with a parser if a condition holds """
+        self.line(f'if {condition}:')
+        self._indent += 1
+        self.node(parser)
+        self._indent -= 1
+
+    def recognize(self, parser:Combinator) -> None:
+        """ The code matching a parser (see Parser.recognize) """
+        #pylint: disable=too-many-branches
+        if isinstance(parser, Lit):
+            self.lit(parser)
+        elif isinstance(parser, cs) and parser._single: #pylint: disable=protected-access
+            self.chars(parser)
+        elif isinstance(parser, (cs, rs)):
+            self.regex(parser)
+        elif isinstance(parser, CClass):
+            self.line('pass')
+        elif isinstance(parser, Id):
+            self.node(resolve(parser.subparser))
+        elif isinstance(parser, Seq):
+            self.seq(parser)
+        elif isinstance(parser, Choice):
+            self.choice(parser)
+        elif isinstance(parser, Repeat):
+            self.repeat(parser)
+        elif isinstance(parser, Fused):
+            self.fused(parser)
+        else:
+            raise TypeError(f"Can't compile {type(parser).__name__} parsers")
+
+    def leaf(self, end:str, leaf:str) -> None:
+        """ Code adding a matched leaf and skipping the whitespace after it """
+        self.line(f'out.append({leaf})')
+        self.line(f'pos = _skip(src, {end}).end()')
+
+    def lit(self, parser:Lit) -> None:
+        """ The code of a Lit """
+        self.line(f'if src.startswith({parser.string!r}, pos):')
+        self._indent += 1
+        self.leaf(f'pos + {len(parser.string)}', repr(parser.string))
+        self._indent -= 1
+        self.line('else:')
+        self.line(f'    pos = _failed(fail, pos, {self.index(parser)})')
+
+    def chars(self, parser:cs) -> None:
+        """ The code of a cs of single characters """
+        index = self.index(parser)
+        chars = self.constant(f'_c{index}', repr(frozenset(parser.string)))
+        self.line('t = src[pos:pos + 1]')
+        self.line(f'if t in {chars}:')
+        self._indent += 1
+        self.leaf('pos + 1', 't')
+        self._indent -= 1
+        self.line('else:')
+        self.line(f'    pos = _failed(fail, pos, {index})')
+
+    def regex(self, parser:cs|rs) -> None:
+        """ The code of a cs or rs, as a regular expression """
+        index = self.index(parser)
+
+        if isinstance(parser, cs):
+            # The strings are longest first, so the first alternative to match is the longest
+            pattern = f"re.compile({'|'.join(map(re.escape, parser.string))!r}).match"
+        else:
+            pattern = f're.compile({parser.raw!r}, {parser.regex.flags}).match'
+
+        match = self.constant(f'_m{index}', pattern)
+        # Anchors and lookbehinds only see the input from the offset (see rs.recognizeRest)
+        behind = isinstance(parser, rs) and parser._behind #pylint: disable=protected-access
+        self.line(f'm = {match}(src[pos:])' if behind else f'm = {match}(src, pos)')
+        self.line('if m is None:')
+        self.line(f'    pos = _failed(fail, pos, {index})')
+        self.line('else:')
+        self._indent += 1
+        self.line('e = pos + m.end()' if behind else 'e = m.end()')
+        self.leaf('e', 'src[pos:e]')
+        self._indent -= 1
+
+    def seq(self, parser:Seq) -> None:
+        """ The code of a Seq: each subparser after the first gets a new recursion frame """
+        for position, child in enumerate(map(resolve, parser.subparsers)):
+            if position == 0:
+                self.node(child)
+                continue
+
+            shift = id(child) in self._rules.shifted
+            self.line('if pos >= 0:')
+            self._indent += 1
+            if shift:
+                self.line('frames.append({})')
+            self.node(child)
+            if shift:
+                self.line('frames.pop()')
+            self._indent -= 1
+
+    def choice(self, parser:Choice) -> None:
+        """ The code of a Choice: each alternative is only tried if the ones before it failed """
+        index = self.index(parser)
+        children = [(child, resolve(child)) for child in parser.subparsers]
+        dispatch = any(child.first is not None and not child.nullable for _, child in children)
+
+        if dispatch:
+            self.line(f'c{index} = src[pos:pos + 1]')
+        if not all(isLeaf(child) for _, child in children):
+            self.line(f'b{index} = len(out)')
+
+        for position, (original, child) in enumerate(children):
+            conditions = ['pos < 0'] if position else []
+
+            if child.first is not None and not child.nullable:
+                first = self.constant(f'_d{index}_{position}', repr(child.first))
+                conditions.append(f'c{index} in {first}')
+            # Choice only checks the parsers it holds for recursion, and a defer never is (see State.inRecursion)
+            if not isinstance(original, defer) and id(child) in self._rules.guarded:
+                conditions.append(f'{self.index(child)} not in frames[-1]')
+
+            if position == 0 and conditions:
+                self.line('pos = -1')
+
+            if conditions:
+                self.line(f'if {" and ".join(conditions)}:')
+                self._indent += 1
+            if position or conditions:
+                self.line(f'pos = s{index}')
+            self.node(child)
+            if not isLeaf(child):
+                self.line('if pos < 0:')
+                self.line(f'    del out[b{index}:]')
+            if conditions:
+                self._indent -= 1
+
+    def repeat(self, parser:Repeat) -> None:
+        """ The code of a Repeat: items past the minimum are optional, and stop once one of them matches nothing """
+        index = self.index(parser)
+        subparser = resolve(parser.subparser)
+        separator = None if parser.separator is None else resolve(parser.separator)
+        bound = parser.minimum if parser.maximum is None else parser.maximum
+        optional = bound > parser.minimum
+
+        self.line(f'i{index} = 0')
+        self.line('while True:' if bound == inf else f'while i{index} < {bound}:')
+        self._indent += 1
+        self._loops += 1
+
+        if optional:
+            self.line(f't{index} = pos')
+            self.line(f'n{index} = len(out)')
+        if separator is not None:
+            self.block(f'i{index}', separator)
+            self.block('pos >= 0', subparser)
+        else:
+            self.node(subparser)
+
+        self.line('if pos < 0:')
+        if optional:
+            self.line(f'    if i{index} >= {parser.minimum}:')
+            self.line(f'        pos = t{index}')
+            self.line(f'        del out[n{index}:]')
+        self.line('    break')
+        self.line(f'i{index} += 1')
+        if optional:
+            self.line(f'if pos == t{index} and i{index} > {parser.minimum}:')
+            self.line('    break')
+
+        self._loops -= 1
+        self._indent -= 1
+
+    def fused(self, parser:Fused) -> None:
+        """ The code of a Fused pattern; if it doesn't match, the original parsers find where the parse failed """
+        index = self.index(parser)
+        leaves:list[str] = []
+        template = parser.original.patternCore(WHITE, leaves)
+        self.constant(f'_f{index}, _g{index}', f'_fused({template!r}, {tuple(leaves)!r}, white)')
+
+        self.line(f'm = _f{index}(src, pos)')
+        self.line('if m is None:')
+        self._indent += 1
+        self.node(parser.original)
+        self._indent -= 1
+        self.line('else:')
+        self.line(f'    out.extend([leaf for leaf in map(m.group, _g{index}) if leaf is not None])')
+        self.line('    pos = m.end()')
+
+
+def generate(grammar:Combinator) -> str:
+    """
+    The source of a standalone Python module parsing the grammar, which doesn't need comber to run. Its parse function
+    returns the tree, and its errors match comber's. Emitters have to be importable by name.
+    """
+    return Generator(grammar).source()
+
+
+def compile(grammar:Combinator) -> Callable[..., Any]: #pylint: disable=redefined-builtin
+    """
+    Compile a grammar into a parse function, which parses like the grammar does (without memoization), but faster. The
+    result of a parse has the same source, pos, text, tree and result as the grammar's State would.
+    """
+    generator = Generator(grammar, standalone=False)
+    source = generator.source()
+    namespace:dict[str, Any] = {f'_emit{index}': emit for index, emit in generator.emitters.items()}
+    exec(builtins.compile(source, f'<comber {grammar!r}>', 'exec'), namespace) #pylint: disable=exec-used
+
+    def error(source:str, offset:int, index:int) -> ParseError:
+        state = State(source, None, offset)
+        if offset >= len(source):
+            return EndOfInputError(state, generator.parsers[index], offset)
+        return ParseError(state, generator.parsers[index], offset)
+
+    namespace['_error'] = error
+    return namespace['parse']
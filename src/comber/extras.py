@@ -4,28 +4,75 @@ Additional non-core parsers.
 from typing import Iterable, List, Optional
 import re
 from .parser import State, Expect
-from .combinator import Combinator, asCombinator
+from .combinator import Combinator, asCombinator, leafPattern
 
 #pylint: disable=invalid-name
 class cs(Combinator):
     """
-    Parse one of a list of strings, or one of a character in a string.
+    Parse one of a list of strings, or one of a character in a string. If more than one string matches, the longest
+    one is used.
     """
     recurse = True # As an optimization - there's no way cs can recurse, so don't check
 
     def __init__(self, string:Iterable) -> None:
         super().__init__()
-        self.string = tuple(set(string))
+        strings = set(string)
+        self.string = tuple(sorted(strings, key=lambda string: (-len(string), string)))
+        self._strings = frozenset(strings)
+        self._initials = frozenset(string[0:1] for string in strings)
+        # Lookups are by length, longest first
+        self._lengths = tuple(sorted({len(string) for string in strings}, reverse=True))
+        self._single = self._lengths == (1, )
+        self._encoded = frozenset(string.encode() for string in strings)
+        self._byteLengths = tuple(sorted({len(string) for string in self._encoded}, reverse=True))
 
     def expect(self, state:Expect) -> List[str]:
         return list(self.string)
 
+    def isNullable(self) -> bool:
+        return '' in self._strings
+
+    def firstSet(self) -> frozenset[str]|None:
+        return self._initials - {''}
+
+    def isRegular(self) -> bool:
+        return True
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        if self._single:
+            return leafPattern('[' + ''.join(map(re.escape, self.string)) + ']', white, leaves)
+        # Longest first, so the first alternative that matches is the longest match
+        return leafPattern('|'.join(map(re.escape, self.string)), white, leaves)
+
     def recognize(self, state:State) -> Optional[State]:
-        for string in self.string:
-            if state.text.startswith(string):
-                state.consume(len(string))
+        if state.binary:
+            return self.recognizeBytes(state)
+
+        initial = state.source[state.pos:state.pos + 1]
+
+        if self._single:
+            if initial in self._strings:
+                state.consume(1)
+                return state
+
+        elif initial in self._initials or '' in self._initials:
+            for length in self._lengths:
+                string = state.source[state.pos:state.pos + length]
+                if string in self._strings:
+                    state.consume(len(string))
+                    return state
+
+        state.fail(self, state.pos)
+        return None
+
+    def recognizeBytes(self, state:State) -> Optional[State]:
+        """ Recognize the strings' UTF-8 encodings """
+        for length in self._byteLengths:
+            if bytes(state.source[state.pos:state.pos + length]) in self._encoded:
+                state.consume(length)
                 return state
 
+        state.fail(self, state.pos)
         return None
 
     def __hash__(self) -> int:
@@ -35,29 +82,334 @@ class cs(Combinator):
         return f'cs({self.string})'
 
 
+_escapes = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a'}
+_zeroWidthEscapes = 'bBAZ'
+_quantifier = re.compile(r'\{(\d*)(,\d*)?\}')
+# Non-ASCII characters that case-insensitive patterns match for ASCII letters
+_caseFolds = {'i': '\u0130\u0131', 's': '\u017f', 'k': '\u212a'}
+First = Optional[frozenset[str]]
+# Backreferences, named groups and global flags don't survive being embedded in a larger pattern
+_unembeddable = re.compile(r'\\[1-9g]|\(\?P|\(\?<[^=!]|\(\?[aiLmsux]+\)')
+
+
+class _RegexScanner:
+    """
+    Works out which characters a regular expression's matches can start with, and whether it can match nothing. Any
+    construct it doesn't understand gives up on the first characters (None, meaning anything).
+    """
+    def __init__(self, raw:str) -> None:
+        self.raw = raw
+        self.pos = 0
+
+    def peek(self, length:int = 1) -> str:
+        """ The next characters of the expression """
+        return self.raw[self.pos:self.pos + length]
+
+    def alternation(self) -> tuple[First, bool]:
+        """ A set of |-separated branches, up to a closing parenthesis or the end """
+        first, nullable = self.sequence()
+
+        while self.peek() == '|':
+            self.pos += 1
+            branchFirst, branchNullable = self.sequence()
+            first = None if first is None or branchFirst is None else first | branchFirst
+            nullable = nullable or branchNullable
+
+        return first, nullable
+
+    def sequence(self) -> tuple[First, bool]:
+        """ A run of quantified atoms """
+        first:First = frozenset()
+        nullable = True
+
+        while self.pos < len(self.raw) and self.peek() not in '|)':
+            atomFirst, atomNullable = self.atom()
+            atomNullable = self.quantifier() or atomNullable
+
+            if nullable:
+                first = None if first is None or atomFirst is None else first | atomFirst
+                nullable = atomNullable
+
+        return first, nullable
+
+    def quantifier(self) -> bool:
+        """ Skip a quantifier, returning True if it allows zero repetitions """
+        char = self.peek()
+        optional = False
+
+        if char in ('*', '?'):
+            self.pos += 1
+            optional = True
+        elif char == '+':
+            self.pos += 1
+        elif char == '{':
+            matched = _quantifier.match(self.raw, self.pos)
+            if matched:
+                self.pos = matched.end()
+                optional = not matched[1] or int(matched[1]) == 0
+
+        if self.peek() and self.peek() in '?+' and (optional or char in '+{'):
+            # Lazy or possessive
+            self.pos += 1
+
+        return optional
+
+    def atom(self) -> tuple[First, bool]:
+        """ A single character, class, escape or group """
+        char = self.peek()
+        self.pos += 1
+        found:tuple[First, bool] = (frozenset(char), False)
+
+        if char == '(':
+            found = self.group()
+        elif char == '[':
+            found = (self.charClass(), False)
+        elif char == '\\':
+            escaped = self.peek()
+            self.pos += 1
+            if escaped in _zeroWidthEscapes:
+                found = (frozenset(), True)
+            elif escaped.isdigit():
+                # A backreference might match nothing
+                found = (None, True)
+            else:
+                found = (self.escape(escaped), False)
+        elif char in '^$':
+            found = (frozenset(), True)
+        elif char == '.':
+            found = (None, False)
+
+        return found
+
+    def group(self) -> tuple[First, bool]:
+        """ A parenthesized group, after the opening parenthesis """
+        known = True
+
+        if self.peek() == '?':
+            if self.peek(2) in ('?:', '?>'):
+                self.pos += 2
+            elif self.peek(2) == '?P' and self.peek(3) != '?P=':
+                self.pos = self.raw.index('>', self.pos) + 1
+            elif self.peek(2) in ('?=', '?!') or self.peek(3) in ('?<=', '?<!'):
+                # Lookarounds only restrict what follows
+                self.pos += 3 if self.peek(2) == '?<' else 2
+                self.alternation()
+                self.pos += 1
+                return frozenset(), True
+            else:
+                # Flags, comments, conditionals...
+                known = False
+                self.pos = self.raw.index(')', self.pos) if self.peek(2) in ('?#', '?(') else self.pos + 1
+                while self.peek() and self.peek() not in ':)':
+                    self.pos += 1
+                if self.peek() == ')':
+                    self.pos += 1
+                    return None, True
+                self.pos += 1
+
+        first, nullable = self.alternation()
+        self.pos += 1
+
+        return first if known else None, nullable
+
+    def charClass(self) -> First:
+        """ A bracketed character class, after the opening bracket """
+        chars:set[str] = set()
+        known = self.peek() != '^'
+        start = self.pos
+
+        while self.pos < len(self.raw) and (self.peek() != ']' or self.pos == start or self.raw[start:self.pos] == '^'):
+            char = self.peek()
+            self.pos += 1
+
+            if char == '\\':
+                escaped = self.peek()
+                self.pos += 1
+                member = self.escape('\x08' if escaped == 'b' else escaped)
+            else:
+                member = frozenset(char)
+
+            if member is None or len(member) != 1:
+                known = False
+            elif self.peek() == '-' and self.peek(2) != '-]' and self.peek(2)[1:] not in ('', ']'):
+                self.pos += 1
+                end = self.peek()
+                self.pos += 1
+                if end == '\\':
+                    end = self.peek()
+                    self.pos += 1
+                    endMember = self.escape(end)
+                    if endMember is None or len(endMember) != 1:
+                        known = False
+                        continue
+                    end = next(iter(endMember))
+                low = ord(next(iter(member)))
+                if ord(end) - low > 0xff:
+                    known = False
+                chars.update(map(chr, range(low, ord(end) + 1)))
+            else:
+                chars.update(member)
+
+        self.pos += 1
+
+        return frozenset(chars) if known else None
+
+    @staticmethod
+    def escape(char:str) -> First:
+        """ The character an escape sequence stands for """
+        if char in _escapes:
+            return frozenset(_escapes[char])
+        if char.isalnum() or not char:
+            # Character categories and numeric escapes
+            return None
+        return frozenset(char)
+
+
+def regexFirst(raw:str, caseInsensitive:bool = False) -> tuple[First, bool]:
+    """
+    The characters matches of a regular expression can start with (None if they could start with anything), and
+    whether it can match an empty string.
+    """
+    try:
+        first, nullable = _RegexScanner(raw).alternation()
+    except ValueError:
+        return None, True
+
+    if first is not None and caseInsensitive:
+        if any(ord(char) > 0x7f for char in first):
+            return None, nullable
+
+        first = frozenset(
+            folded
+            for char in first
+            for folded in char.lower() + char.upper() + _caseFolds.get(char.lower(), '')
+            )
+
+    return first, nullable
+
+
+def looksBehind(raw:str) -> bool:
+    """
+    Whether a regular expression has a start anchor or a lookbehind, and so depends on the text before its match.
+    """
+    pos = 0
+
+    while pos < len(raw):
+        if raw[pos] == '\\':
+            if raw[pos + 1:pos + 2] == 'A':
+                return True
+            pos += 2
+        elif raw[pos] == '[':
+            # Skip the class - a ^ or ] just after its bracket is part of it
+            pos += 2 if raw[pos + 1:pos + 2] == '^' else 1
+            pos += raw[pos:pos + 1] == ']'
+            while pos < len(raw) and raw[pos] != ']':
+                pos += 2 if raw[pos] == '\\' else 1
+            pos += 1
+        elif raw[pos] == '^' or raw.startswith(('(?<=', '(?<!'), pos):
+            return True
+        else:
+            pos += 1
+
+    return False
+
+
 #pylint: disable=invalid-name
 class rs(Combinator):
     """
-    Parse using a regular expression
+    Parse using a regular expression. A pattern given as bytes is used as it is for bytes input, and matches strings
+    as if each byte were a character; a string pattern is encoded in UTF-8 to match bytes.
     """
     recurse = True # As an optimization - there's no way rs can recurse, so don't check
 
-    def __init__(self, regex:str, caseInsensitive=False) -> None:
+    def __init__(self, regex:str|bytes, caseInsensitive=False) -> None:
         super().__init__()
+        flags = re.IGNORECASE if caseInsensitive else 0
+        # Compiled the first time bytes are parsed
+        self._bytesRegex:re.Pattern|None = None
+
+        if isinstance(regex, bytes):
+            self._bytesRegex = re.compile(regex, flags)
+            regex = regex.decode('latin-1')
+
         self.raw = regex
         self.regex = re.compile(
             self.raw,
-            re.IGNORECASE if caseInsensitive else 0)
+            flags)
+        self._first, self._nullable = regexFirst(regex, caseInsensitive)
+        if self._bytesRegex is not None and self._first is not None and not all(map(str.isascii, self._first)):
+            # A bytes pattern's first characters stand for bytes, which aren't what they'd encode to in UTF-8
+            self._first = None
+        # Matched against the rest of the input, so ^ is where the match starts and nothing before it can be seen
+        self._behind = looksBehind(regex)
 
     def expect(self, state:Expect) -> List[str]:
         return [f'/{self.raw}/']
 
+    def isNullable(self) -> bool:
+        return self._nullable or self.regex.match('') is not None
+
+    def firstSet(self) -> frozenset[str]|None:
+        return self._first
+
+    def isRegular(self) -> bool:
+        # Fused patterns are encoded to match bytes, which only works for ASCII (see bytesRegex)
+        return _unembeddable.search(self.raw) is None and self.raw.isascii() and not self._behind
+
+    def pattern(self, white:str, leaves:list[str]) -> str:
+        flags = 'i' if self.regex.flags & re.IGNORECASE else ''
+        return leafPattern(f'(?{flags}:{self.raw})', white, leaves)
+
+    def prepare(self) -> None:
+        if self.raw.isascii():
+            self.bytesRegex()
+
+    def bytesRegex(self) -> re.Pattern:
+        """
+        The pattern for matching bytes. A string pattern with characters outside ASCII can't be encoded into one - a
+        character class or repeat of them would match single bytes of their encodings - so raises a ValueError.
+        """
+        if self._bytesRegex is None:
+            if not self.raw.isascii():
+                raise ValueError(f"Can't match bytes with the non-ASCII pattern {self.raw!r} - give rs a bytes pattern")
+            regex = re.compile(self.raw.encode(), self.regex.flags & ~re.UNICODE)
+            if self.frozen:
+                return regex
+            self._bytesRegex = regex
+        return self._bytesRegex
+
     def recognize(self, state:State) -> Optional[State]:
-        matched = self.regex.match(state.text)
+        regex = (self._bytesRegex or self.bytesRegex()) if state.binary else self.regex
+
+        if self._behind:
+            return self.recognizeRest(state, regex)
+
+        matched = regex.match(state.source, state.pos)
+        # A match that runs to the end of a stream's buffer may carry on past it
+        while matched and matched.end() == len(state.source) and state.more():
+            matched = regex.match(state.source, state.pos)
+
+        if matched:
+            state.consume(matched.end() - state.pos)
+            return state
+
+        state.fail(self, state.pos)
+        return None
+
+    def recognizeRest(self, state:State, regex:re.Pattern) -> Optional[State]:
+        """ Recognize by matching a copy of the rest of the input (or a view, for bytes) """
+        def rest() -> str|memoryview:
+            return memoryview(state.source)[state.pos:] if state.binary else state.source[state.pos:] # type: ignore
+
+        matched = regex.match(rest())
+        while matched and state.pos + matched.end() == len(state.source) and state.more():
+            matched = regex.match(rest())
+
         if matched:
-            state.consume(len(matched[0]))
+            state.consume(matched.end())
             return state
 
+        state.fail(self, state.pos)
         return None
 
     def __hash__(self) -> int:
@@ -94,6 +446,10 @@ class defer(Combinator):
 
         return self._coreparser
 
+    @subparser.setter
+    def subparser(self, coreparser:Combinator) -> None:
+        self._coreparser = coreparser
+
     def fill(self, coreparser:Combinator) -> None:
         """
         Fill in the parser for this deferred parser.
@@ -103,10 +459,18 @@ class defer(Combinator):
     def expect(self, state:Expect) -> List[str]:
         return self.subparser.expect(state)
 
+    def children(self) -> tuple[Combinator, ...]:
+        if self._coreparser is None:
+            return ()
+        return (self._coreparser, )
+
+    def isNullable(self) -> bool:
+        return self._coreparser is not None and self._coreparser.nullable
+
     def recognize(self, state:State) -> State|None:
         raise NotImplementedError('Deferred parsers have no recogizer')
 
-    def parseCore(self, state:State) -> State:
+    def parseCore(self, state:State) -> State|None:
         return self.subparser.parseCore(state)
 
     def simplify(self) -> Combinator:
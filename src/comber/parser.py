@@ -1,7 +1,15 @@
 """
 Base parser definitions.
 """
-from typing import cast, Optional, Callable, Any
+from typing import cast, Optional, Callable, Any, AsyncIterable, AsyncIterator, Iterable, Iterator, IO, Union
+from bisect import bisect_left
+from concurrent.futures import Executor, ThreadPoolExecutor
+import asyncio
+import re
+import mmap
+import sys
+import threading
+import time
 from abc import abstractmethod
 
 
@@ -29,31 +37,369 @@ class Expect:
         return not parser.recurse and parser in self._recurseStack[-1]
 
 
-class State:
+Source = Union[str, bytes, bytearray, memoryview, mmap.mmap]
+"""
+Types of input text. Anything other than a string is parsed as bytes: the grammar's strings are matched in UTF-8.
+"""
+
+
+_whitespacePatterns:dict[str|bytes, re.Pattern] = {}
+
+def whitespacePattern(whitespace:str|None, binary:bool = False) -> Optional[re.Pattern]:
+    """
+    A compiled pattern matching a run of the given whitespace characters, or None if whitespace is disabled. If binary
+    is True, the pattern matches bytes.
+    """
+    if not whitespace:
+        return None
+
+    key:str|bytes = whitespace.encode() if binary else whitespace
+
+    if key not in _whitespacePatterns:
+        pattern = '[' + re.escape(whitespace) + ']*'
+        _whitespacePatterns[key] = re.compile(pattern.encode() if binary else pattern)
+
+    return _whitespacePatterns[key]
+
+
+class LineIndex:
+    """
+    Converts offsets into a text to lines and columns. The newline offsets are found once, the first time a position is
+    asked for. If the text is part of a larger one, line and char are where it starts.
+    """
+    def __init__(self, text:Source, line:int = 1, char:int = 1) -> None:
+        self._text = text
+        self._line = line
+        self._char = char
+        self._newlines:list[int]|None = None
+
+    def position(self, offset:int) -> tuple[int, int]:
+        """
+        The line and character (both starting at 1) of an offset into the text.
+        """
+        if self._newlines is None:
+            newline = '\n' if isinstance(self._text, str) else b'\n'
+            self._newlines = [match.start() for match in re.finditer(newline, self._text)]
+
+        line = bisect_left(self._newlines, offset)
+
+        if not line:
+            return self._line, offset + self._char
+
+        return self._line + line, offset - self._newlines[line - 1]
+
+
+class Token:
+    """
+    A leaf that points into the source instead of copying its text out. Tokens compare equal to strings (or bytes)
+    with the same text, and only become strings when read.
+    """
+    # The length rather than the end offset is kept, since short lengths are shared small ints
+    __slots__ = ('source', 'start', 'length')
+
+    def __init__(self, source:Source, start:int, end:int) -> None:
+        self.source = source
+        """ The complete input text """
+        self.start = start
+        """ Offset of the start of the token into the source """
+        self.length = end - start
+        """ Length of the token """
+
+    @property
+    def end(self) -> int:
+        """ Offset of the end of the token into the source """
+        return self.start + self.length
+
+    @property
+    def text(self) -> Source:
+        """ The text of the token """
+        return self.source[self.start:self.start + self.length]
+
+    def __str__(self) -> str:
+        text = self.source[self.start:self.start + self.length]
+        return text if isinstance(text, str) else bytes(text).decode(errors='replace')
+
+    def __repr__(self) -> str:
+        return f'Token({self.text!r}, {self.start}, {self.end})'
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __eq__(self, other:Any) -> bool:
+        if isinstance(other, Token):
+            other = other.text
+        elif not isinstance(other, (str, bytes, bytearray)):
+            return NotImplemented
+        return self.text == other
+
+    def __hash__(self) -> int:
+        text = self.text
+        return hash(text if isinstance(text, (str, bytes)) else bytes(text))
+
+
+def emitLeaves(emit:'Emitter', branch:list) -> Any:
+    """
+    Call an emitter on a branch. Tokens are passed to it as their text, unless it takes tokens.
+    """
+    if not getattr(emit, 'takesTokens', False):
+        branch = [leaf.text if isinstance(leaf, Token) else leaf for leaf in branch]
+
+    return emit(*branch)
+
+
+class Thunk:
+    """
+    An emitter call put off until the parse is over, so that it's only made for the parse that's kept. The value is
+    made the first time it's asked for.
+    """
+    __slots__ = ('emit', 'branch', 'value')
+
+    def __init__(self, emit:'Emitter', branch:list) -> None:
+        self.emit:'Emitter|None' = emit
+        self.branch:list|None = branch
+        self.value:Any = None
+
+    def force(self) -> Any:
+        """
+        The emitter's value.
+        """
+        if self.emit is not None:
+            branch = [leaf.force() if isinstance(leaf, Thunk) else leaf for leaf in cast(list, self.branch)]
+            self.value = emitLeaves(self.emit, branch)
+            self.emit = None
+            self.branch = None
+
+        return self.value
+
+
+CHUNK_SIZE = 65536
+""" Default number of characters read at a time when parsing a stream """
+
+STEPS = 100
+""" Default number of items an asynchronous parse commits to between giving up the interpreter """
+
+MEMO_SIZE = 65536
+""" Default maximum number of entries in a packrat memo table. """
+
+RECURSION_LIMIT = 1000000
+""" Python's recursion limit while parsing (see RecursionLimit) """
+
+
+class RecursionLimit:
+    """
+    Raises Python's recursion limit while any parse is running, and puts it back once none are. Each level of nested
+    input takes a few Python calls; from Python 3.11 they don't use the C stack, so how deeply input can be nested is
+    only limited by memory. Before that, the limit is left alone.
+    """
+    def __init__(self, limit:int) -> None:
+        self.limit = limit
+        """ The recursion limit while parsing """
+        self._lock = threading.Lock()
+        self._parses = 0
+        self._saved = 0
+
+    def __enter__(self) -> None:
+        with self._lock:
+            if not self._parses:
+                self._saved = sys.getrecursionlimit()
+                sys.setrecursionlimit(max(self._saved, self.limit))
+            self._parses += 1
+
+    def __exit__(self, *args:Any) -> None:
+        with self._lock:
+            self._parses -= 1
+            if not self._parses:
+                sys.setrecursionlimit(self._saved)
+
+
+deepRecursion = RecursionLimit(RECURSION_LIMIT if sys.version_info >= (3, 11) else 0)
+""" Held around each parse """
+
+
+class Memo:
+    """
+    A packrat memo table, holding the outcome of compound parsers by parser and offset. When the table grows past its
+    size the least recently used entries are dropped.
+
+    Memoized parses don't need the recursion guard: a parser that heads a left-recursive cycle (see analyze) grows its
+    result from a failed seed instead, re-parsing until the match stops getting longer.
+    """
+    def __init__(self, size:int|None = MEMO_SIZE) -> None:
+        self.size = size
+        """ Maximum number of entries, or None for no limit """
+        self.hits = 0
+        """ Number of parses answered from the table """
+        self.misses = 0
+        """ Number of parses that had to be run """
+        # An entry is the end offset and leaves of a successful parse, or None for a failure
+        self._table:dict[tuple[int, int], tuple[int, list]|None] = {}
+        self._growing:dict[tuple[int, int], tuple[int, list]|None] = {}
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def clear(self) -> None:
+        """
+        Forget every entry.
+        """
+        self._table.clear()
+
+    def parse(self, parser:'Parser', state:'State') -> 'State|None':
+        """
+        Parse with a parser, or replay its outcome if it's already been tried here.
+        """
+        if not parser.memoizable:
+            return parser.parseFresh(state)
+
+        key = (id(parser), state.pos)
+
+        if key in self._growing:
+            self.hits += 1
+            return self.replay(self._growing[key], state)
+
+        if key in self._table:
+            self.hits += 1
+            entry = self._table.pop(key)
+            self._table[key] = entry
+            return self.replay(entry, state)
+
+        self.misses += 1
+
+        if parser.recursionHead:
+            return self.grow(parser, state, key)
+
+        # The mark keeps the leaves parsed from being handed off (see EventState) before they're remembered
+        mark = state.mark()
+        newState = parser.parseFresh(state)
+
+        if newState is None:
+            state.rollback(mark)
+            self.remember(key, None)
+        else:
+            self.remember(key, (newState.pos, newState._tree[-1][mark[2]:])) #pylint: disable=protected-access
+            newState.commit()
+
+        return newState
+
+    def grow(self, parser:'Parser', state:'State', key:tuple[int, int]) -> 'State|None':
+        """
+        Parse a left-recursive parser, starting from a failure and re-parsing as long as each parse gets further.
+        """
+        mark = state.mark()
+        branch = state._tree[-1] #pylint: disable=protected-access
+        end = -1
+        entry:tuple[int, list]|None = None
+        self._growing[key] = entry
+
+        while True:
+            newState = parser.parseFresh(state)
+
+            if newState is None or newState.pos <= end:
+                break
+
+            end = newState.pos
+            entry = (end, branch[mark[2]:])
+            self._growing[key] = entry
+            state.rollback(mark)
+            mark = state.mark()
+
+        state.rollback(mark)
+        del self._growing[key]
+
+        self.remember(key, entry)
+        return self.replay(entry, state)
+
+    def replay(self, entry:tuple[int, list]|None, state:'State') -> 'State|None':
+        """
+        Apply a remembered outcome to a state.
+        """
+        if entry is None:
+            return None
+
+        state.pos = entry[0]
+        state._tree[-1].extend(entry[1]) #pylint: disable=protected-access
+        return state
+
+    def remember(self, key:tuple[int, int], entry:tuple[int, list]|None) -> None:
+        """
+        Add an entry, evicting the least recently used one if the table is full.
+        """
+        self._table[key] = entry
+
+        if self.size is not None and len(self._table) > self.size:
+            del self._table[next(iter(self._table))]
+
+
+class State: #pylint: disable=too-many-instance-attributes,too-many-public-methods
     """
     Internal parse state.
     """
+    handler:'Handler|None' = None
+    """ If set, the handler for the events of the parse (see EventState) """
+    base = 0
+    """ Offset of the source into the whole input (see StreamState) """
+
     def __init__(self,
-            text:str,
+            text:Source,
             whitespace:str|None,
 
-            line:int = 1,
-            char:int = 1,
+            pos:int = 0,
+            lines:LineIndex|None = None,
             tree:list[list]|None = None,
-            recurseStack:list[list[int]]|None = None,
+            recurseStack:list[dict[int, int]]|None = None,
+            memo:Memo|None = None,
+            failure:list|None = None,
+            fuse:bool = True,
+            build:bool = True,
+            spans:bool = False,
+            deferred:bool = False,
             ) -> None:
-        self.text = text
+        self.source = text
+        """ The complete input text; never modified """
+        self.pos = pos
+        """ Offset of the unparsed input into the source """
+        self._lines = lines if lines is not None else LineIndex(text)
+        self.memo = memo
+        """ The packrat memo table, if memoization is turned on """
+        # The furthest offset any parser failed at, and the outermost parser that failed there
+        self._failure:list = failure if failure is not None else [-1, None]
+        self._tree:list[list] = tree if tree is not None else [[]]
+        self._recurseStack:list[dict[int, int]] = recurseStack if recurseStack is not None else [{}]
+        self.fuse = fuse
+        """ If False, fused patterns run the subgrammars they were made from """
+        self.build = build
+        """ If False, only recognize the input: leaves aren't kept and emitters don't run """
+        self.emitting = build
+        """ If False, emitters aren't run """
+        self.spans = spans
+        """ If True, leaves are Tokens pointing into the source rather than strings """
+        self.deferred = deferred
+        """ If True, emitters aren't called until the parse is over (see resolve) """
+        self.whitespace = whitespace
+        """ The whitespace characters skipped after each leaf """
+        self.binary = not isinstance(text, str)
+        """ If True, the source is bytes (or a buffer of them), and leaves are too """
+        self._white = whitespacePattern(whitespace, self.binary)
+
+    @property
+    def text(self) -> Source:
         """ Unparsed input """
-        self.line = line
+        return self.source[self.pos:]
+
+    @property
+    def line(self) -> int:
         """ Current line offset into the input text (starts at 1) """
-        self.char = char
+        return self._lines.position(self.pos)[0]
+
+    @property
+    def char(self) -> int:
         """ Current character offset into the current line (starts at 1) """
-        self.eof = False
-        """ True if we have it the end of the text """
-        self._tree:list[list] = tree if tree is not None else [[]]
-        self._recurseStack:list[list[int]] = recurseStack if recurseStack is not None else [[]]
-        self._whitespace = whitespace
-        self._parent:State|None = None
+        return self._lines.position(self.pos)[1]
+
+    @property
+    def eof(self) -> bool:
+        """ True if we have hit the end of the text """
+        return self.pos >= len(self.source)
 
     @property
     def result(self) -> Any:
@@ -67,44 +413,53 @@ class State:
         """
         return self._tree[0]
 
-    def advance(self, text:str) -> None:
-        """ Advance current line and char based on a chunk of text """
-        lines = text.count('\n')
-
-        self.line += lines
-        self.char = \
-            len(text) - (text.rfind('\n') + 1) \
-            if lines \
-            else self.char + len(text)
-
     def eatWhite(self) -> None:
         """
         Consume the leading whitespace, if whitespace was defined.
         """
-        if self._whitespace:
-            text = self.text.lstrip(self._whitespace)
-            eaten = self.text[0:len(self.text) - len(text)]
-            self.text = text
-
-            self.advance(eaten)
-            self.eof = not self.text
+        if self._white:
+            self.pos = cast(re.Match, self._white.match(self.source, self.pos)).end()
 
     def consume(self, length:int) -> None:
         """
         Consume a number of characters in the stream.
         """
-        eaten = text = self.text[0:length]
-        self.text = self.text[length:]
+        end = self.pos + length
+        if self.build:
+            if self.spans:
+                self._tree[-1].append(Token(self.source, self.pos, end))
+            else:
+                self._tree[-1].append(self.source[self.pos:end])
 
-        if self._whitespace:
-            stripped = self.text.lstrip(self._whitespace)
-            eaten = text + self.text[0:len(self.text) - len(stripped)]
-            self.text = stripped
+        if self._white:
+            end = cast(re.Match, self._white.match(self.source, end)).end()
 
-        self.advance(eaten)
+        self.pos = end
 
-        self._tree[-1].append(text)
-        self.eof = not self.text
+    def consumeMatch(self, matched:re.Match, groups:tuple[int, ...]) -> None:
+        """
+        Consume a match of a fused pattern, including its trailing whitespace. Each of the groups that took part in the
+        match is a leaf.
+        """
+        if self.build and self.spans:
+            self._tree[-1].extend(
+                Token(self.source, *matched.span(group))
+                for group in groups
+                if matched.start(group) >= 0)
+        elif self.build:
+            self._tree[-1].extend(
+                leaf
+                for leaf in (matched.group(group) for group in groups)
+                if leaf is not None)
+        self.pos = matched.end()
+
+    def take(self, length:int, value:Any) -> None:
+        """
+        Consume a number of bytes, with a value read from them as the leaf. Whitespace isn't skipped.
+        """
+        if self.build:
+            self._tree[-1].append(value)
+        self.pos += length
 
     def pushLeaf(self, value:Any) -> None:
         """
@@ -112,6 +467,38 @@ class State:
         """
         self._tree[-1].append(value)
 
+    def emitBranch(self, emit:'Emitter') -> None:
+        """
+        Pop a stack branch and push what an emitter makes of it, or a Thunk to make it later if emitters are deferred.
+        """
+        branch = self._tree.pop()
+
+        if self.deferred:
+            self._tree[-1].append(Thunk(emit, branch))
+        elif self.spans:
+            self._tree[-1].append(emitLeaves(emit, branch))
+        else:
+            self._tree[-1].append(emit(*branch))
+
+    def release(self) -> list:
+        """
+        Take what's been parsed so far out of the tree, and forget whatever the parse can no longer backtrack to. Only
+        call this once a parse has committed to everything before it.
+        """
+        leaves = self._tree[0]
+        self._tree[0] = []
+
+        if self.memo is not None:
+            self.memo.clear()
+
+        return leaves
+
+    def resolve(self) -> None:
+        """
+        Run the deferred emitters of the tree.
+        """
+        self._tree[0][:] = [leaf.force() if isinstance(leaf, Thunk) else leaf for leaf in self._tree[0]]
+
     def pushBranch(self) -> None:
         """
         Push a new stack branch.
@@ -124,58 +511,58 @@ class State:
         """
         return self._tree.pop()
 
-    def pushState(self) -> 'State':
+    def mark(self) -> tuple[int, int, int]:
         """
-        Extend this state.
+        A point to roll back to if a trial parse fails. Trying a parse adds to the tree in place, so this is all it
+        takes; a successful parse is kept as it is.
         """
-        stack = list(self._recurseStack)
-        stack[-1] = list(stack[-1])
-        tree = list(self._tree)
-        tree.append([])
-        state = State(
-            self.text,
-            self._whitespace,
-            self.line,
-            self.char,
-            tree,
-            stack
-            )
-        state._parent = self #pylint: disable=protected-access
-
-        return state
+        return self.pos, len(self._tree), len(self._tree[-1])
 
-    def popState(self) -> 'State':
+    def rollback(self, mark:tuple[int, int, int]) -> None:
         """
-        Collapse an extended state.
+        Undo everything parsed since a mark.
         """
-        state = cast(State, self._parent) #pylint: disable=protected-access
+        pos, depth, size = mark
+        self.pos = pos
+        del self._tree[depth:]
+        del self._tree[-1][size:]
 
-        state.text = self.text
-        state.line = self.line
-        state.char = self.char
-        state.eof = self.eof
-        state._tree[-1] += self._tree[-1] #pylint: disable=protected-access
+    def commit(self) -> None:
+        """
+        Keep everything parsed since the last mark: the trial parse succeeded.
+        """
 
-        return state
+    def more(self) -> bool:
+        """
+        Read more input, if there's any that hasn't been (see StreamState). Returns True if anything was read.
+        """
+        return False
 
     def pushParser(self, parser:'Parser') -> None:
         """
         Push the current parser.
         """
-        self._recurseStack[-1].append(id(parser))
+        frame = self._recurseStack[-1]
+        key = id(parser)
+        frame[key] = frame.get(key, 0) + 1
 
-    #pylint: disable=unused-argument
     def popParser(self, parser:'Parser') -> None:
         """
         Pop the last parser.
         """
-        self._recurseStack[-1].pop()
+        frame = self._recurseStack[-1]
+        key = id(parser)
+
+        if frame[key] > 1:
+            frame[key] -= 1
+        else:
+            del frame[key]
 
     def shiftParser(self) -> None:
         """
         Create a new recursion stack because we're looking for the element in a sequence
         """
-        self._recurseStack.append([])
+        self._recurseStack.append({})
 
     def unshiftParser(self) -> None:
         """
@@ -183,27 +570,261 @@ class State:
         """
         self._recurseStack.pop()
 
+    def fail(self, parser:'Parser', pos:int) -> None:
+        """
+        Note that a parser failed to match at an offset.
+        """
+        if pos >= self._failure[0]:
+            self._failure[0] = pos
+            self._failure[1] = parser
+
+    def error(self) -> 'ParseError':
+        """
+        The error to report for a failed parse: the outermost parser that failed the furthest into the input.
+        """
+        pos, parser = self._failure
+        if pos >= len(self.source):
+            return EndOfInputError(self, parser, pos)
+        else:
+            return ParseError(self, parser, pos)
+
     def inRecursion(self, parser:Any) -> bool:
         """
-        See if we're already trying to parse a given parser.
+        See if we're already trying to parse a given parser. Memoized parses handle recursion by growing seeds instead.
+        """
+        return not parser.recurse and self.memo is None and id(parser) in self._recurseStack[-1]
+
+
+class Handler:
+    """
+    Receives the events of a parse (see Parser.events). Override the methods for the events you want.
+    """
+    def wants(self, parser:'Parser') -> bool:
+        """
+        Whether to report the start and end of a parser. By default, only named parsers are.
+        """
+        return parser.name is not None
+
+    def enter(self, parser:'Parser') -> None:
+        """
+        A parser started matching.
+        """
+
+    def token(self, token:Token) -> None:
+        """
+        A leaf was parsed.
+        """
+
+    def exit(self, parser:'Parser') -> None:
+        """
+        A parser finished matching.
+        """
+
+
+class EventState(State):
+    """
+    Parse state that hands its leaves, and the starts and ends of parsers, to a handler instead of building a tree.
+    Events are held while a trial parse they're part of might still be rolled back, and handed off as soon as no mark
+    is outstanding.
+    """
+    def __init__(self, text:Source, whitespace:str|None, handler:Handler, **options:Any) -> None:
+        super().__init__(text, whitespace, spans=True, fuse=False, **options)
+        self.handler = handler
+        self.emitting = False
+        self._trials = 0
+
+    def mark(self) -> tuple[int, int, int]:
+        self._trials += 1
+        return super().mark()
+
+    def rollback(self, mark:tuple[int, int, int]) -> None:
+        self._trials -= 1
+        super().rollback(mark)
+
+    def commit(self) -> None:
+        self._trials -= 1
+        if not self._trials:
+            self.flush()
+
+    def take(self, length:int, value:Any) -> None:
+        # Handlers see the bytes a value was read from
+        self._tree[-1].append(Token(self.source, self.pos, self.pos + length))
+        self.pos += length
+
+    def flush(self) -> None:
+        """
+        Hand off the events parsed so far.
+        """
+        for event in self._tree[0]:
+            if isinstance(event, Token):
+                self.handler.token(event)
+            else:
+                event[0](event[1])
+
+        self._tree[0].clear()
+
+
+class StreamState(State):
+    """
+    Parse state reading its input a chunk at a time. The source is a buffer, which each leaf parsed tops up to a window
+    past where it ends, until the input runs out. Offsets only ever grow as the buffer is filled, until release drops
+    the part already parsed.
+    """
+    def __init__(self,
+            text:Source,
+            whitespace:str|None,
+            chunks:Iterator[Source],
+            window:int = CHUNK_SIZE,
+            **options:Any) -> None:
+        super().__init__(text, whitespace, **options)
+        self._chunks:Iterator[Source]|None = chunks
+        self.window = window
+        """ How far past the current offset the buffer is kept filled """
+        self.fill(self.pos + window)
+
+    def more(self) -> bool:
+        size = len(self.source)
+        self.fill(size + 1)
+        return len(self.source) > size
+
+    def fill(self, size:int) -> None:
+        """
+        Read chunks until the buffer is at least size long, or the input runs out.
+        """
+        parts = [self.source]
+        total = len(self.source)
+
+        while total < size and self._chunks is not None:
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                self._chunks = None
+                break
+
+            parts.append(chunk)
+            total += len(chunk)
+
+        line, char = self._lines.position(0)
+        self.source = self.source[:0].join(parts)
+        self._lines = LineIndex(self.source, line, char)
+
+    def eatWhite(self) -> None:
+        super().eatWhite()
+        # A run of whitespace may carry on past the buffer
+        while self._white and self.pos == len(self.source) and self.more():
+            super().eatWhite()
+        self.topUp()
+
+    def topUp(self) -> None:
+        """
+        Fill the buffer to a window past the current offset, unless it already is.
         """
-        return not parser.recurse and id(parser) in self._recurseStack[-1]
+        if self._chunks is not None and len(self.source) - self.pos < self.window:
+            self.fill(self.pos + self.window)
+
+    def consume(self, length:int) -> None:
+        if self.pos + length > len(self.source):
+            self.fill(self.pos + length)
+
+        super().consume(length)
+
+        # The whitespace after the leaf may have used up the lookahead
+        if self.pos == len(self.source):
+            self.eatWhite()
+        else:
+            self.topUp()
+
+    def consumeMatch(self, matched:re.Match, groups:tuple[int, ...]) -> None:
+        super().consumeMatch(matched, groups)
+        self.topUp()
+
+    def release(self) -> list:
+        leaves = super().release()
+
+        # Dropping the parsed part of the buffer copies the rest, so wait until that's worth doing
+        if self.pos >= self.window:
+            pos = self.pos
+            line, char = self._lines.position(pos)
+            self.base += pos
+            self._failure[0] -= pos
+            self.source = self.source[pos:]
+            self._lines = LineIndex(self.source, line, char)
+            self.pos = 0
+
+        return leaves
+
+
+def chunksOf(source:IO|Iterable[Source], size:int) -> Iterator[Source]:
+    """
+    The chunks of a file, read size characters at a time, or of an iterable of strings (or bytes).
+    """
+    if hasattr(source, 'read'):
+        read = cast(IO, source).read
+        return iter(lambda: read(size) or None, None)
+
+    return iter(cast(Iterable[Source], source))
+
+
+async def readChunk(source:asyncio.StreamReader|AsyncIterator[Source], size:int) -> Source|None:
+    """
+    The next chunk of an asyncio stream, read up to size bytes at a time, or of an async iterator of strings. Returns
+    None, or an empty chunk, at the end.
+    """
+    if isinstance(source, asyncio.StreamReader):
+        return await source.read(size)
+
+    return await anext(source, None)
 
 
 class ParseError(Exception):
     """
     When a string cannot be parsed, this exception is thrown.
     """
-    def __init__(self, state:State, parser:'Parser') -> None:
+    def __init__(self, state:State, parser:'Parser', offset:int|None = None) -> None:
         super().__init__('Unexpected text')
-        self.line = state.line
+        self.source = state.source
+        """ The input text. When parsing a stream, only the part of it that was buffered. """
+        self.base = state.base
+        """ The offset of the source into the whole input. """
+        self.offset = state.base + (state.pos if offset is None else offset)
+        """ The offset into the input text the error occurred at. """
+        self.parser = parser
+        """ The parser that failed. """
+        self._lines = state._lines #pylint: disable=protected-access
+
+    def __reduce__(self) -> tuple:
+        # The constructor takes a state, so rebuild from the attributes instead
+        return (self.__class__.__new__, (self.__class__, *self.args), self.__dict__)
+
+    def trim(self, length:int = 80) -> 'ParseError':
+        """
+        Drop all of the source but the length characters from where the error occurred, so the error can be kept, or
+        pickled, without holding on to the whole input. Returns the error.
+        """
+        offset = self.offset - self.base
+        line, char = self._lines.position(offset)
+        self.source = self.source[offset:offset + length]
+        if isinstance(self.source, memoryview):
+            # A view would hold on to the whole input, and can't be pickled
+            self.source = self.source.tobytes()
+        self.base = self.offset
+        self._lines = LineIndex(self.source, line, char)
+        return self
+
+    @property
+    def line(self) -> int:
         """ The input line the error occurred at. """
-        self.char = state.char
+        return self._lines.position(self.offset - self.base)[0]
+
+    @property
+    def char(self) -> int:
         """ The character offset into the line the error occurred at. """
-        self.text = state.text
+        return self._lines.position(self.offset - self.base)[1]
+
+    @property
+    def text(self) -> Source:
         """ The unparsed input text. """
-        self.parser = parser
-        """ The parser that failed. """
+        return self.source[self.offset - self.base:]
 
     @property
     def expected(self) -> list[str]:
@@ -213,9 +834,13 @@ class ParseError(Exception):
     @property
     def message(self) -> str:
         """ A lazy version of the exception message. """
+        unexpected = self.source[self.offset - self.base:self.offset - self.base + 10]
+        if not isinstance(unexpected, str):
+            unexpected = bytes(unexpected).decode(errors='replace')
+
         return str(self.line)+":"+str(self.char)+": " \
             +'Unexpected text: ' \
-            +self.text[0:10] \
+            +unexpected \
             +'. Expected one of: ' \
             +', '.join(self.expected)
 
@@ -240,6 +865,14 @@ Type of emitter functions.
 """
 
 
+def takesTokens(emit:Emitter) -> Emitter:
+    """
+    Mark an emitter as wanting its leaves as Tokens, when parsing with spans.
+    """
+    emit.takesTokens = True #type: ignore[attr-defined]
+    return emit
+
+
 class Parser:
     """
     Base parser.
@@ -249,6 +882,8 @@ class Parser:
     """ If True, the parser class is allowed to recurse without any checks. """
     compound = False
     """ If True, the parser class is a compound class, and so may fail partway through. """
+    frozen = False
+    """ If True, the parser can't be changed (see Combinator.freeze) """
 
     def __init__(self) -> None:
         self.name:Optional[str] = None
@@ -257,46 +892,246 @@ class Parser:
         """ Internalizer function; if not provided, the result will be the parsed string """
         self.whitespace:str|None = ' \t\n'
         """ Default whitespace """
+        self.memoize = False
+        """ If True, parse with a packrat memo table (see analyze) """
+        self.memoSize:int|None = MEMO_SIZE
+        """ Maximum number of entries in the memo table """
+        self.nullable = False
+        """ If True, the parser may succeed without consuming any input (see analyze) """
+        self.first:frozenset[str]|None = None
+        """ The characters a match of this parser can start with, or None for any character (see analyze) """
+        self.memoizable = True
+        """ If False, memoized parses always run this parser (see analyze) """
+        self.recursionHead = False
+        """ If True, this parser heads a left-recursive cycle, and memoized parses grow it from a seed (see analyze) """
+        self.fused = False
+        """ If True, parts of the grammar have been fused into patterns (see analyze) """
+
+    def __setattr__(self, name:str, value:Any) -> None:
+        if self.frozen:
+            raise TypeError(f"Can't change {name} of a frozen parser")
+        super().__setattr__(name, value)
+
+    def __call__(self, #pylint: disable=too-many-arguments
+            text:Source,
+            whitespace:str|None=None,
+            build:bool=True,
+            spans:bool=False,
+            deferred:bool=False,
+            ) -> State:
+        """
+        Parse a string, or bytes. If build is False, the input is only recognized: the state's tree stays empty, and no emitters
+        are run. If spans is True, leaves are Tokens pointing into the text rather than strings. If deferred is True,
+        emitters are only run once the whole parse has succeeded, and only for the parse that was kept.
+        """
+        state = self.run(self.start(text, whitespace, build=build, spans=spans, deferred=deferred))
+
+        if deferred:
+            state.resolve()
+
+        return state
+
+
+    def events(self, text:Source, handler:Handler, whitespace:str|None=None) -> State:
+        """
+        Parse a string, handing the handler each leaf, and the start and end of each parser it wants, in order. Events
+        are handed off as soon as the parse can no longer backtrack past them; if the parse fails, the ones before
+        that point will have been handed off before the error is raised. No tree is built, and no emitters are run.
+        """
+        state = self.run(self.start(text, whitespace, kind=EventState, handler=handler))
+        cast(EventState, state).flush()
+        return state
+
+
+    def parseStream(self,
+            source:IO|Iterable[Source],
+            chunkSize:int = CHUNK_SIZE,
+            whitespace:str|None = None,
+            step:Callable[[], None]|None = None,
+            ) -> State:
+        """
+        Parse a file, or an iterable of strings (or bytes), reading chunkSize characters at a time as they're needed.
+        Parts of the input the parse can no longer backtrack to are dropped - for a grammar that's a repetition, the
+        buffer only needs to hold the item being parsed and a chunk of lookahead. Leaves are matched against at least a
+        chunk of lookahead, so no leaf should need more. If given, step is called each time the parse commits to more
+        of the input.
+        """
+        chunks = chunksOf(source, chunkSize)
+        # The first chunk decides whether the input is text or bytes
+        state = self.start(next(chunks, ''), whitespace, kind=StreamState, chunks=chunks, window=chunkSize)
+        tree:list = []
+
+        for newState in self.items(state):
+            tree.extend(newState.release())
+            state = newState
+            if step is not None:
+                step()
+
+        state.tree.extend(tree)
+        return state
+
+
+    async def parseAsync(self,
+            source:asyncio.StreamReader|AsyncIterable[Source],
+            chunkSize:int = CHUNK_SIZE,
+            whitespace:str|None = None,
+            steps:int = STEPS,
+            executor:Executor|None = None,
+            ) -> State:
+        """
+        Parse from an asyncio stream, or an async iterable of strings (or bytes), like parseStream. The parse runs in
+        the executor, or a thread of its own, and awaits the chunks on the loop as it needs them; every steps times it
+        commits to more of the input, it gives up the interpreter, so the loop isn't kept waiting on a long parse. If
+        the awaiting task is cancelled, the parse stops at its next chunk or step.
+
+        The parse holds on to its thread while it waits for input, so an executor shared with other work should have
+        a thread for each parse that may be waiting at once.
+        """
+        loop = asyncio.get_running_loop()
+        owned = ThreadPoolExecutor(1, thread_name_prefix='parseAsync') if executor is None else None
+        reader = source if isinstance(source, asyncio.StreamReader) else aiter(source)
+        stopped = threading.Event()
+        count = 0
+
+        def chunks() -> Iterator[Source]:
+            while not stopped.is_set():
+                chunk = asyncio.run_coroutine_threadsafe(readChunk(reader, chunkSize), loop).result()
+                if not chunk:
+                    return
+                yield chunk
+            raise asyncio.CancelledError()
+
+        def step() -> None:
+            nonlocal count
+            count += 1
+            if not count % steps:
+                if stopped.is_set():
+                    raise asyncio.CancelledError()
+                time.sleep(0)
 
-    def __call__(self, text:str, whitespace:str|None=None) -> State:
+        try:
+            return await loop.run_in_executor(
+                executor or owned, self.parseStream, chunks(), chunkSize, whitespace, step)
+        finally:
+            stopped.set()
+            if owned is not None:
+                owned.shutdown(wait=False)
+
+
+    def iterparse(self, text:Source, whitespace:str|None=None) -> Iterator[Any]:
+        """
+        Parse a string, yielding what would be the state's tree a value at a time. If the grammar is a repetition,
+        each item's values are yielded as soon as the parse commits to the item, and then forgotten; otherwise they're
+        all yielded at the end.
+        """
+        for state in self.items(self.start(text, whitespace)):
+            yield from state.release()
+
+
+    def items(self, state:State) -> Iterator[State]:
+        """
+        Parse from a started state, yielding it whenever the parse has committed to everything parsed so far. Raises
+        the error if the parse fails.
+        """
+        yield self.run(state)
+
+
+    def run(self, state:State) -> State:
+        """
+        Parse from a started state, raising the error if the parse fails.
+        """
+        with deepRecursion:
+            newState = self.parseCore(state)
+
+        if newState is None:
+            if self.fused and state.fuse:
+                # Fused patterns can't tell how far into them a parse got, so find the error without them
+                base = state.base
+                state = self.start(
+                    state.source,
+                    state.whitespace,
+                    lines=state._lines, #pylint: disable=protected-access
+                    fuse=False,
+                    build=False)
+                state.base = base
+                with deepRecursion:
+                    self.parseCore(state)
+
+            raise state.error()
+
+        return newState
+
+
+    def matches(self, text:Source, whitespace:str|None=None) -> int|None:
+        """
+        Recognize a string, without building a tree. Returns the offset the match ends at, or None if it doesn't match.
+        (To find out where it failed, call the parser with build=False instead.)
+        """
+        with deepRecursion:
+            state = self.parseCore(self.start(text, whitespace, build=False))
+        return None if state is None else state.pos
+
+
+    def start(self, text:Source, whitespace:str|None, kind:type[State]=State, **options:Any) -> State:
         """
-        Parse a string.
+        A state of the given kind for parsing a string from the start, with any leading whitespace consumed. The
+        options are passed on to the state.
         """
-        state = State(text, whitespace if whitespace is not None else self.whitespace)
+        state = kind(
+            text,
+            whitespace if whitespace is not None else self.whitespace,
+            memo=Memo(self.memoSize) if self.memoize else None,
+            **options)
         state.eatWhite()
-        return self.parseCore(state)
+        return state
+
+
+    def parseCore(self, state:State) -> State|None:
+        """
+        Internal parse function, for calling by subparsers. Returns None if the parse fails.
+        """
+        if state.memo is not None:
+            return state.memo.parse(self, state)
+
+        return self.parseFresh(state)
 
 
-    def parseCore(self, state:State) -> State:
+    def parseFresh(self, state:State) -> State|None:
         """
-        Internal parse function, for calling by subparsers.
+        Parse without consulting the memo table.
         """
-        if self.emit:
+        start = state.pos
+        emit = self.emit if state.emitting else None
+        handler = state.handler
+
+        if handler is not None and not handler.wants(self):
+            handler = None
+
+        if handler is not None:
+            state.pushLeaf((handler.enter, self))
+
+        if emit:
             state.pushBranch()
 
         if not self.recurse:
             state.pushParser(self)
 
-        try:
-            newState = self.recognize(state)
-        except ParseError:
-            # Nothing that Can recurse will actually throw
-            #if not self.recurse:
-            state.popParser(self)
-            raise
+        newState = self.recognize(state)
 
         if newState is None:
-            if state.eof:
-                raise EndOfInputError(state, self)
-            else:
-                raise ParseError(state, self)
+            if not self.recurse:
+                state.popParser(self)
+            state.fail(self, start)
+            return None
 
         if not self.recurse:
             newState.popParser(self)
 
-        if self.emit is not None:
-            value = self.emit(*newState.popBranch())
-            newState.pushLeaf(value)
+        if emit is not None:
+            newState.emitBranch(emit)
+
+        if handler is not None:
+            newState.pushLeaf((handler.exit, self))
 
         return newState
 
@@ -323,10 +1158,13 @@ class Parser:
         return self.repr()
 
 
-    def analyze(self) -> None:
+    def analyze(self, memoize:bool = False, memoSize:int|None = MEMO_SIZE) -> None:
         """
-        Analyze the grammar to improve performance.
+        Analyze the grammar to improve performance. If memoize is True, parses will keep a packrat memo table of up to
+        memoSize entries (None for no limit).
         """
+        self.memoize = memoize
+        self.memoSize = memoSize
 
 
     @abstractmethod
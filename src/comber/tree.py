@@ -0,0 +1,210 @@
+"""
+Compact parse trees: the nodes of a parse kept in flat arrays, rather than as nested lists of strings.
+"""
+from typing import Any, Iterator
+from array import array
+from .parser import Parser, Handler, Token
+
+RULE = 0
+""" Kind of a node for a parser """
+TOKEN = 1
+""" Kind of a node for a leaf """
+
+
+class CompactTree(Handler):
+    """
+    A parse tree stored as parallel arrays, one entry per node, in the order the nodes start. The nodes are the leaves,
+    and the parsers that are named or have emitters. Each is a handful of machine integers, rather than a list or
+    string; the arrays can be written out with tobytes, or shared as buffers.
+    """
+    def __init__(self, source:str) -> None:
+        self.source = source
+        """ The complete input text """
+        self.rules:list[Parser] = []
+        """ The parsers the rule nodes are for """
+        self.kinds = array('B')
+        """ The kind of each node: RULE or TOKEN """
+        self.ruleIds = array('i')
+        """ The index into rules of each rule node, or -1 for a token """
+        self.starts = array('q')
+        """ The offset into the source each node starts at """
+        self.ends = array('q')
+        """ The offset into the source each node ends at """
+        self.parents = array('q')
+        """ The index of the parent of each node, or -1 for a top level node """
+        self.sizes = array('q')
+        """ The number of nodes under each node """
+        self._ruleIndex:dict[int, int] = {}
+        self._open:list[int] = []
+        # Rule nodes that haven't had a token yet, so don't know where they start
+        self._unstarted:list[int] = []
+        self._last = 0
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index:int) -> 'Node':
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return Node(self, index % len(self))
+
+    @property
+    def roots(self) -> list['Node']:
+        """ The top level nodes """
+        return list(self.children(-1))
+
+    @property
+    def tree(self) -> list:
+        """
+        The tree in the form a parser's state has it, with the emitters run.
+        """
+        return [value for node in self.children(-1) for value in self.values(node.index)]
+
+    def children(self, index:int) -> Iterator['Node']:
+        """
+        The nodes directly under a node, or the top level nodes for -1.
+        """
+        child = index + 1
+        end = len(self) if index < 0 else index + 1 + self.sizes[index]
+
+        while child < end:
+            yield Node(self, child)
+            child += self.sizes[child] + 1
+
+    def values(self, index:int) -> list:
+        """
+        What a node contributes to its parent's branch: its text, or the values of its children, or what its emitter
+        makes of those.
+        """
+        if self.kinds[index] == TOKEN:
+            return [self.source[self.starts[index]:self.ends[index]]]
+
+        values = [value for child in self.children(index) for value in self.values(child.index)]
+        emit = self.rules[self.ruleIds[index]].emit
+
+        return [emit(*values)] if emit else values
+
+    def wants(self, parser:Parser) -> bool:
+        return parser.name is not None or parser.emit is not None
+
+    def enter(self, parser:Parser) -> None:
+        key = id(parser)
+        if key not in self._ruleIndex:
+            self._ruleIndex[key] = len(self.rules)
+            self.rules.append(parser)
+
+        index = self.add(RULE, self._ruleIndex[key], self._last, self._last)
+        self._open.append(index)
+        self._unstarted.append(index)
+
+    def token(self, token:Token) -> None:
+        for index in self._unstarted:
+            self.starts[index] = token.start
+        self._unstarted.clear()
+
+        self.add(TOKEN, -1, token.start, token.end)
+        self._last = token.end
+
+    def exit(self, parser:Parser) -> None:
+        index = self._open.pop()
+
+        if self._unstarted and self._unstarted[-1] == index:
+            # Nothing was parsed, so the node is empty
+            self._unstarted.pop()
+            self.starts[index] = self._last
+
+        self.ends[index] = self._last
+        self.sizes[index] = len(self) - index - 1
+
+    def add(self, kind:int, rule:int, start:int, end:int) -> int:
+        """
+        Add a node under the innermost open rule node. Returns its index.
+        """
+        self.kinds.append(kind)
+        self.ruleIds.append(rule)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.parents.append(self._open[-1] if self._open else -1)
+        self.sizes.append(0)
+        return len(self) - 1
+
+
+class Node:
+    """
+    A view of one node of a compact tree.
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree:CompactTree, index:int) -> None:
+        self.tree = tree
+        """ The tree the node is in """
+        self.index = index
+        """ The index of the node in the tree's arrays """
+
+    @property
+    def kind(self) -> int:
+        """ RULE or TOKEN """
+        return self.tree.kinds[self.index]
+
+    @property
+    def parser(self) -> Parser|None:
+        """ The parser of a rule node, or None for a token """
+        rule = self.tree.ruleIds[self.index]
+        return None if rule < 0 else self.tree.rules[rule]
+
+    @property
+    def name(self) -> str|None:
+        """ The name of the node's parser, if any """
+        parser = self.parser
+        return None if parser is None else parser.name
+
+    @property
+    def start(self) -> int:
+        """ The offset into the source the node starts at """
+        return self.tree.starts[self.index]
+
+    @property
+    def end(self) -> int:
+        """ The offset into the source the node ends at """
+        return self.tree.ends[self.index]
+
+    @property
+    def text(self) -> str:
+        """ The source text the node covers """
+        return self.tree.source[self.start:self.end]
+
+    @property
+    def parent(self) -> 'Node|None':
+        """ The node this one is under, or None at the top level """
+        parent = self.tree.parents[self.index]
+        return None if parent < 0 else Node(self.tree, parent)
+
+    @property
+    def children(self) -> list['Node']:
+        """ The nodes directly under this one """
+        return list(self.tree.children(self.index))
+
+    @property
+    def values(self) -> list:
+        """ What the node contributes to the tree, in the form a parser's state would have it """
+        return self.tree.values(self.index)
+
+    def __eq__(self, other:Any) -> bool:
+        return isinstance(other, Node) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self) -> str:
+        if self.kind == TOKEN:
+            return f'Node({self.text!r})'
+        return f'Node({self.parser!r}, {self.start}, {self.end})'
+
+
+def compact(grammar:Parser, text:str, whitespace:str|None=None) -> CompactTree:
+    """
+    Parse a string into a compact tree.
+    """
+    tree = CompactTree(text)
+    grammar.events(text, tree, whitespace)
+    return tree
@@ -0,0 +1,560 @@
+"""
+A parsing machine: grammars lowered into a flat array of instructions, run by a single dispatch loop.
+"""
+from typing import Any
+import re
+from math import inf
+from .parser import State, whitespacePattern
+from .combinator import Combinator, Lit, Seq, Choice, Repeat, Id, CClass, Fused, reachable
+from .extras import cs, rs, defer
+from .compiler import Rules, resolve, isLeaf
+
+# Instructions are (opcode, argument, argument)
+LIT = 0
+""" (LIT, string, parser): match a literal string """
+SET = 1
+""" (SET, characters, parser): match one of a set of characters """
+MATCH = 2
+""" (MATCH, match, parser): match with a compiled pattern's match method """
+FUSED = 3
+""" (FUSED, fused, fallback): match a fused pattern, or jump to the parsers it was made from """
+CHOICE = 4
+""" (CHOICE, alternative, -): push a backtrack entry that resumes at the alternative """
+COMMIT = 5
+""" (COMMIT, target, -): pop the backtrack entry and jump """
+STEP = 6
+""" (STEP, progressed, stuck): pop the backtrack entry, and jump depending on whether the input was consumed """
+JUMP = 7
+""" (JUMP, target, -) """
+FAIL = 8
+""" (FAIL, -, -): backtrack """
+CALL = 9
+""" (CALL, routine, memoized): push a return entry and jump, unless a memoized routine has been run here before """
+RETURN = 10
+""" (RETURN, -, -): pop the return entry and jump back """
+ENTER = 11
+""" (ENTER, parser, guarded): start a parser's capture - if it fails, it's recorded as a failure """
+EXIT = 12
+""" (EXIT, parser, emitter): finish a parser's capture, passing its leaves to its emitter """
+SHIFT = 13
+""" (SHIFT, -, -): start a new recursion frame """
+UNSHIFT = 14
+""" (UNSHIFT, -, -): drop the recursion frame """
+TEST = 15
+""" (TEST, characters, target): jump unless the next character is one of a set """
+GUARD = 16
+""" (GUARD, parser, target): jump if the parser is already being parsed in this recursion frame """
+END = 17
+""" (END, -, -): the parse succeeded """
+REST = 18
+""" (REST, match, parser): match with a compiled pattern's match method, as though the input started at the offset """
+
+NAMES = (
+    'LIT', 'SET', 'MATCH', 'FUSED', 'CHOICE', 'COMMIT', 'STEP', 'JUMP', 'FAIL', 'CALL', 'RETURN', 'ENTER', 'EXIT',
+    'SHIFT', 'UNSHIFT', 'TEST', 'GUARD', 'END', 'REST')
+
+# Which arguments of each opcode are addresses
+_ADDRESSES = {FUSED: (2, ), CHOICE: (1, ), COMMIT: (1, ), STEP: (1, 2), JUMP: (1, ), CALL: (1, ), TEST: (2, ),
+              GUARD: (2, )}
+
+# Stack entries start with their kind
+_BACKTRACK = 0
+_RETURN = 1
+_MARK = 2
+_SHIFTED = 3
+
+_nothing = re.compile('')
+
+Instruction = tuple[int, Any, Any]
+
+
+class Assembler:
+    """
+    Lowers a grammar into instructions. Named, shared and recursive parsers, and items repeated more than once, become
+    routines; everything else is written out in place.
+    """
+    def __init__(self, grammar:Combinator) -> None:
+        self.grammar = resolve(grammar)
+        self.memoize = grammar.memoize
+        """ If True, the outcomes of routines are memoized """
+        self.memoSize = grammar.memoSize
+        """ Maximum number of memoized outcomes, or None for no limit """
+        self.parsers:list[Combinator] = []
+        """ Each parser in the program, by its index """
+        self._indexes:dict[int, int] = {}
+        self._code:list[list] = []
+        self._labels:list[int] = []
+        self._routines:dict[int, int] = {}
+        self._pending:list[Combinator] = []
+        self._rules = Rules(self.grammar)
+
+        if self.memoize and any(parser.recursionHead for parser in reachable(self.grammar)):
+            # Memoized parses grow left-recursive matches (see Memo.grow), which the machine can't
+            raise TypeError("Can't assemble a memoized grammar with left recursion")
+
+    def index(self, parser:Combinator) -> int:
+        """ The index of a parser in the program """
+        if id(parser) not in self._indexes:
+            self._indexes[id(parser)] = len(self.parsers)
+            self.parsers.append(parser)
+        return self._indexes[id(parser)]
+
+    def label(self) -> int:
+        """ A new label, to be placed later """
+        self._labels.append(-1)
+        return len(self._labels) - 1
+
+    def place(self, label:int) -> None:
+        """ Put a label at the next instruction """
+        self._labels[label] = len(self._code)
+
+    def emit(self, opcode:int, first:Any = None, second:Any = None) -> None:
+        """ Add an instruction """
+        self._code.append([opcode, first, second])
+
+    def routine(self, parser:Combinator) -> int:
+        """ The label of a parser's routine, queuing it to be written """
+        if id(parser) not in self._routines:
+            self._routines[id(parser)] = self.label()
+            self._pending.append(parser)
+        return self._routines[id(parser)]
+
+    def assemble(self) -> list[Instruction]:
+        """ The instructions of the program, starting with the grammar """
+        self.emit(CALL, self.routine(self.grammar))
+        self.emit(END)
+
+        while self._pending:
+            parser = self._pending.pop(0)
+            self.place(self._routines[id(parser)])
+            self.body(parser)
+            self.emit(RETURN)
+
+        for instruction in self._code:
+            for argument in _ADDRESSES.get(instruction[0], ()):
+                instruction[argument] = self._labels[instruction[argument]]
+
+        return [(opcode, first, second) for opcode, first, second in self._code]
+
+    def node(self, parser:Combinator, repeated:bool = False) -> None:
+        """ The instructions parsing with a parser, which may be written out more than once if repeated """
+        if not isLeaf(parser) and (repeated or id(parser) in self._rules.routines):
+            self.emit(CALL, self.routine(parser), self.memoize)
+        else:
+            self.body(parser)
+
+    def body(self, parser:Combinator) -> None:
+        """ The instructions of a parser, with its emitter, recursion guard and failure (see Parser.parseFresh) """
+        if isLeaf(parser) or isinstance(parser, Fused):
+            self.recognize(parser)
+            return
+
+        index = self.index(parser)
+        self.emit(ENTER, index, id(parser) in self._rules.guarded)
+        self.recognize(parser)
+        self.emit(EXIT, index, parser.emit)
+
+    def recognize(self, parser:Combinator) -> None:
+        """ The instructions matching a parser (see Parser.recognize) """
+        #pylint: disable=too-many-branches
+        if isinstance(parser, Lit):
+            self.emit(LIT, parser.string, self.index(parser))
+        elif isinstance(parser, cs) and parser._single: #pylint: disable=protected-access
+            self.emit(SET, frozenset(parser.string), self.index(parser))
+        elif isinstance(parser, cs):
+            # The strings are longest first, so the first alternative to match is the longest
+            self.emit(MATCH, re.compile('|'.join(map(re.escape, parser.string))).match, self.index(parser))
+        elif isinstance(parser, rs):
+            # Anchors and lookbehinds only see the input from the offset (see rs.recognizeRest)
+            behind = parser._behind #pylint: disable=protected-access
+            self.emit(REST if behind else MATCH, parser.regex.match, self.index(parser))
+        elif isinstance(parser, CClass):
+            pass
+        elif isinstance(parser, Id):
+            self.node(resolve(parser.subparser))
+        elif isinstance(parser, Seq):
+            self.seq(parser)
+        elif isinstance(parser, Choice):
+            self.choice(parser)
+        elif isinstance(parser, Repeat):
+            self.repeat(parser)
+        elif isinstance(parser, Fused):
+            self.fused(parser)
+        else:
+            raise TypeError(f"Can't assemble {type(parser).__name__} parsers")
+
+    def seq(self, parser:Seq) -> None:
+        """ A Seq: each subparser after the first gets a new recursion frame """
+        for position, child in enumerate(map(resolve, parser.subparsers)):
+            shift = position > 0 and id(child) in self._rules.shifted
+            if shift:
+                self.emit(SHIFT)
+            self.node(child)
+            if shift:
+                self.emit(UNSHIFT)
+
+    def choice(self, parser:Choice) -> None:
+        """ A Choice: each alternative gets a backtrack entry, and is skipped if it can't match the next character """
+        end = self.label()
+        fail = self.label()
+        failing = False
+        last = len(parser.subparsers) - 1
+
+        for position, original in enumerate(parser.subparsers):
+            child = resolve(original)
+            following = self.label() if position < last else fail
+
+            if child.first is not None and not child.nullable:
+                self.emit(TEST, child.first, following)
+                failing = failing or position == last
+            # Choice only checks the parsers it holds for recursion, and a defer never is (see State.inRecursion)
+            if not isinstance(original, defer) and id(child) in self._rules.guarded:
+                self.emit(GUARD, self.index(child), following)
+                failing = failing or position == last
+
+            if position < last:
+                self.emit(CHOICE, following)
+                self.node(child)
+                self.emit(COMMIT, end)
+                self.place(following)
+            else:
+                self.node(child)
+
+        if failing:
+            self.emit(JUMP, end)
+            self.place(fail)
+            self.emit(FAIL)
+        self.place(end)
+
+    def repeat(self, parser:Repeat) -> None:
+        """ A Repeat: items past the minimum each get a backtrack entry, and stop once one of them matches nothing """
+        item = resolve(parser.subparser)
+        separator = None if parser.separator is None else resolve(parser.separator)
+        bound = parser.minimum if parser.maximum is None else parser.maximum
+        firstAlone = parser.minimum == 0 and separator is not None and bound > 0
+        copies = parser.minimum + (1 + firstAlone if bound == inf else int(bound) - parser.minimum)
+        repeated = copies > 1
+
+        def one(parsed:int) -> None:
+            if parsed > 0 and separator is not None:
+                self.node(separator, repeated)
+            self.node(item, repeated)
+
+        for parsed in range(parser.minimum):
+            one(parsed)
+
+        if bound <= parser.minimum:
+            return
+
+        out = self.label()
+
+        if bound == inf:
+            loop = self.label()
+            if firstAlone:
+                self.emit(CHOICE, out)
+                one(0)
+                self.emit(STEP, loop, out)
+            self.place(loop)
+            self.emit(CHOICE, out)
+            one(max(parser.minimum, 1))
+            self.emit(STEP, loop, out)
+        else:
+            for parsed in range(parser.minimum, int(bound)):
+                following = self.label()
+                self.emit(CHOICE, out)
+                one(parsed)
+                self.emit(STEP, following, out)
+                self.place(following)
+
+        self.place(out)
+
+    def fused(self, parser:Fused) -> None:
+        """ A Fused pattern; if it doesn't match, the original parsers find where the parse failed """
+        fallback = self.label()
+        end = self.label()
+        self.emit(FUSED, parser, fallback)
+        self.emit(JUMP, end)
+        self.place(fallback)
+        self.node(parser.original)
+        self.place(end)
+
+
+class Program:
+    """
+    A grammar lowered into instructions for the parsing machine. It parses like the grammar does without memoization,
+    but keeps its backtrack entries, routine calls and captures on one explicit stack, rather than copying states or
+    recursing in Python.
+    """
+    def __init__(self, grammar:Combinator) -> None:
+        assembler = Assembler(grammar)
+        self.grammar = assembler.grammar
+        self.code = assembler.assemble()
+        """ The instructions """
+        self.parsers = assembler.parsers
+        """ The parsers instructions refer to, by index """
+        self.memoize = assembler.memoize
+        """ If True, the outcomes of routines are memoized """
+        self.memoSize = assembler.memoSize
+        """ Maximum number of memoized outcomes, or None for no limit """
+
+    def __call__(self, text:str, whitespace:str|None=None) -> State:
+        """
+        Parse a string.
+        """
+        #pylint: disable=too-many-locals,too-many-branches,too-many-statements
+        whitespace = whitespace if whitespace is not None else self.grammar.whitespace
+        skip = (whitespacePattern(whitespace) or _nothing).match
+        code = self.code
+        stack:list[tuple] = []
+        frames:list[dict[int, int]] = [{}]
+        out:list = []
+        memo:dict[tuple, tuple] = {}
+        memoSize = self.memoSize
+        failPos = -1
+        failIndex = 0
+
+        def remember(key:tuple, outcome:tuple) -> None:
+            # Least recently used first, as in Memo
+            memo[key] = outcome
+            if memoSize is not None and len(memo) > memoSize:
+                del memo[next(iter(memo))]
+
+        pos = skip(text, 0).end()
+        pc = 0
+
+        while True:
+            opcode, first, second = code[pc]
+            pc += 1
+
+            if opcode == LIT:
+                if text.startswith(first, pos):
+                    out.append(first)
+                    pos = skip(text, pos + len(first)).end()
+                    continue
+                if pos >= failPos:
+                    failPos, failIndex = pos, second
+
+            elif opcode == MATCH:
+                matched = first(text, pos)
+                if matched is not None:
+                    end = matched.end()
+                    out.append(text[pos:end])
+                    pos = skip(text, end).end()
+                    continue
+                if pos >= failPos:
+                    failPos, failIndex = pos, second
+
+            elif opcode == SET:
+                char = text[pos:pos + 1]
+                if char in first:
+                    out.append(char)
+                    pos = skip(text, pos + 1).end()
+                    continue
+                if pos >= failPos:
+                    failPos, failIndex = pos, second
+
+            elif opcode == ENTER:
+                frame = None
+                if second:
+                    frame = frames[-1]
+                    frame[first] = frame.get(first, 0) + 1
+                stack.append((_MARK, first, pos, len(out), frame))
+                continue
+
+            elif opcode == EXIT:
+                _, _, _, size, frame = stack.pop()
+                if frame is not None:
+                    release(frame, first)
+                if second is not None:
+                    out[size:] = [second(*flatten(out[size:]) if self.memoize else out[size:])]
+                continue
+
+            elif opcode == CHOICE:
+                stack.append((_BACKTRACK, first, pos, len(out)))
+                continue
+
+            elif opcode == COMMIT:
+                stack.pop()
+                pc = first
+                continue
+
+            elif opcode == CALL:
+                if not second:
+                    stack.append((_RETURN, pc))
+                    pc = first
+                    continue
+
+                # A routine's outcome only depends on where it starts, and what it's guarded against there
+                key = (first, pos, frozenset(frames[-1]))
+                outcome = memo.pop(key, None)
+
+                if outcome is None:
+                    # Failures are counted from the start of the routine, to be memoized with it
+                    stack.append((_RETURN, pc, key, len(out), failPos, failIndex))
+                    failPos = -1
+                    pc = first
+                    continue
+
+                memo[key] = outcome
+                end, leaves, routineFailPos, routineFailIndex = outcome
+                if routineFailPos >= failPos:
+                    failPos, failIndex = routineFailPos, routineFailIndex
+                if end is not None:
+                    out.append(leaves)
+                    pos = end
+                    continue
+
+            elif opcode == RETURN:
+                entry = stack.pop()
+                pc = entry[1]
+                if len(entry) > 2:
+                    _, _, key, size, callerFailPos, callerFailIndex = entry
+                    # The leaves are shared with the memo as one chunk, rather than copied
+                    out[size:] = [Chunk(out[size:])]
+                    remember(key, (pos, out[-1], failPos, failIndex))
+                    if callerFailPos > failPos:
+                        failPos, failIndex = callerFailPos, callerFailIndex
+                continue
+
+            elif opcode == STEP:
+                pc = first if pos > stack.pop()[2] else second
+                continue
+
+            elif opcode == TEST:
+                if text[pos:pos + 1] not in first:
+                    pc = second
+                continue
+
+            elif opcode == GUARD:
+                if first in frames[-1]:
+                    pc = second
+                continue
+
+            elif opcode == SHIFT:
+                frames.append({})
+                stack.append((_SHIFTED, ))
+                continue
+
+            elif opcode == UNSHIFT:
+                frames.pop()
+                stack.pop()
+                continue
+
+            elif opcode == JUMP:
+                pc = first
+                continue
+
+            elif opcode == FUSED:
+                pattern, groups = first.compile(whitespace)
+                matched = pattern.match(text, pos)
+                if matched is not None:
+                    out.extend(leaf for leaf in map(matched.group, groups) if leaf is not None)
+                    pos = matched.end()
+                else:
+                    pc = second
+                continue
+
+            elif opcode == REST:
+                matched = first(text[pos:])
+                if matched is not None:
+                    end = pos + matched.end()
+                    out.append(text[pos:end])
+                    pos = skip(text, end).end()
+                    continue
+                if pos >= failPos:
+                    failPos, failIndex = pos, second
+
+            elif opcode == END:
+                return State(text, whitespace, pos, tree=[flatten(out) if self.memoize else out])
+
+            # Backtrack to the last choice, noting each parser that failed on the way
+            while stack:
+                entry = stack.pop()
+
+                if entry[0] == _BACKTRACK:
+                    _, pc, pos, size = entry
+                    del out[size:]
+                    break
+
+                if entry[0] == _MARK:
+                    _, index, start, _, frame = entry
+                    if start >= failPos:
+                        failPos, failIndex = start, index
+                    if frame is not None:
+                        release(frame, index)
+
+                elif entry[0] == _SHIFTED:
+                    frames.pop()
+
+                elif len(entry) > 2:
+                    _, _, key, _, callerFailPos, callerFailIndex = entry
+                    remember(key, (None, None, failPos, failIndex))
+                    if callerFailPos > failPos:
+                        failPos, failIndex = callerFailPos, callerFailIndex
+
+            else:
+                raise State(text, whitespace, failure=[failPos, self.parsers[failIndex]]).error()
+
+    def __str__(self) -> str:
+        return '\n'.join(
+            f'{address:5} {NAMES[opcode]:8} {describe(first)} {describe(second)}'.rstrip()
+            for address, (opcode, first, second) in enumerate(self.code))
+
+
+class Chunk:
+    """
+    The leaves of a memoized routine, kept together so they can be shared rather than copied.
+    """
+    __slots__ = ('leaves', )
+
+    def __init__(self, leaves:list) -> None:
+        self.leaves = leaves
+
+
+def flatten(leaves:list) -> list:
+    """
+    Leaves with the chunks in them written out in place.
+    """
+    flat:list = []
+    pending = [iter(leaves)]
+
+    while pending:
+        for leaf in pending[-1]:
+            if isinstance(leaf, Chunk):
+                pending.append(iter(leaf.leaves))
+                break
+            flat.append(leaf)
+        else:
+            pending.pop()
+
+    return flat
+
+
+def release(frame:dict[int, int], index:int) -> None:
+    """
+    Note a parser is no longer being parsed in a recursion frame.
+    """
+    if frame[index] > 1:
+        frame[index] -= 1
+    else:
+        del frame[index]
+
+
+def describe(argument:Any) -> str:
+    """
+    An instruction argument, for listings.
+    """
+    if argument is None:
+        return ''
+    if isinstance(argument, frozenset):
+        return repr(''.join(sorted(argument)))
+    if callable(argument) and hasattr(argument, '__self__'):
+        return f'/{getattr(argument.__self__, "pattern", argument)}/'
+    return repr(argument)
+
+
+def assemble(grammar:Combinator) -> Program:
+    """
+    Lower a grammar into a program for the parsing machine.
+    """
+    return Program(grammar)
@@ -0,0 +1,40 @@
+"""
+Grammars and helpers shared by the tests.
+"""
+from comber import C, rs, cs, defer, inf, ParseError
+
+def mathGrammar(convert:bool = True, index:bool = False):
+    """
+    Sums and differences of numbers, with brackets. If convert is True the numbers are ints, and if index is True an
+    expression can be indexed by another, as in 1[2].
+    """
+    number = rs(r'[0-9]+')@(('number', int) if convert else 'number')
+    expression = defer()
+    operations = expression + cs('+-') + expression
+
+    if index:
+        operations |= expression + '[' + expression + ']'
+
+    expression.fill((operations | (C+ '(' + expression + ')') | number)@'expression')
+    return expression
+
+def callGrammar():
+    number = rs(r'[0-9]+')@int
+    expression = defer()@'expression'
+    call = (rs(r'[a-z]+') + '(' + expression[0, inf, ','] + ')')@(lambda name, *args: (name, *args))
+    expression.fill(
+        (expression + cs(['+', '-', '**']) + expression)
+        | (C+ '(' + expression + ')')
+        | call
+        | number)
+    return expression
+
+TEXTS = ['1', '1 + 2', '(1 + 2) ** 3', 'max(1, (2), 3 - 4)', 'f()', 'f(1,)', '(1', 'f(1 2)', '']
+
+def outcome(parser, text):
+    """ What parsing the text gives: the tree and rest of the text, or the error's type, offset and expected """
+    try:
+        state = parser(text)
+        return state.tree, state.text
+    except ParseError as error:
+        return type(error), error.offset, sorted(error.expected)
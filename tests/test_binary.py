@@ -0,0 +1,79 @@
+import struct
+import pytest
+from comber import C, Handler, ParseError, field, magic, blob, records, align, inf
+
+def binary(parser):
+    parser.whitespace = None
+    return parser
+
+def test_field():
+    assert binary(field('<H'))(b'\x01\x02').tree == [0x0201]
+    assert binary(field('>HB'))(b'\x01\x02\x03').tree == [(0x0102, 3)]
+    assert field('<H').expectCore() == ['<<H>']
+
+    with pytest.raises(ParseError):
+        binary(field('<I'))(b'\x01\x02')
+
+def test_binary_whitespace():
+    # A bare binary parser has no whitespace, so a field starting with a space isn't skipped
+    assert field('<H')(b' \x00').tree == [0x20]
+
+    # A grammar with whitespace would skip the 0x20 and read the next two bytes instead
+    with pytest.raises(ValueError):
+        (magic(b'GIF8') + field('<H'))(b'GIF8 \x00\x00')
+
+    with pytest.raises(ValueError):
+        binary(field('<H'))(b' \x00', ' ')
+
+def test_magic():
+    parser = binary(magic(b'GIF8') + field('B'))
+
+    assert parser(b'GIF8\x07').tree == [b'GIF8', 7]
+
+    with pytest.raises(ParseError):
+        parser(b'GIF9\x07')
+
+def test_blob():
+    parser = binary(blob('<H')[0, inf])
+
+    assert parser(b'\x03\x00abc\x00\x00\x01\x00z').tree == [b'abc', b'', b'z']
+
+    with pytest.raises(ParseError):
+        binary(blob('<H'))(b'\x03\x00ab')
+
+def test_records():
+    data = struct.pack('<H3I', 3, 1, 2, 3)
+
+    assert list(binary(records('<I', '<H'))(data).tree[0]) == [1, 2, 3]
+    assert list(binary(records('>H', 2))(struct.pack('>2H', 5, 6)).tree[0]) == [5, 6]
+    assert binary(records('<HB', 2))(struct.pack('<HBHB', 1, 2, 3, 4)).tree == [[(1, 2), (3, 4)]]
+    assert binary(records('<I', '<H'))(struct.pack('<H', 0)).tree[0].tolist() == []
+
+    with pytest.raises(ParseError):
+        binary(records('<I', '<H'))(data[:-1])
+
+def test_align():
+    parser = binary(C+ blob('B') + align(4) + field('<I'))
+
+    assert parser(b'\x02ab\x00\x07\x00\x00\x00').tree == [b'ab', 7]
+    assert parser(b'\x03abc\x07\x00\x00\x00').tree == [b'abc', 7]
+
+def test_binary_grammar():
+    grammar = binary((C+ magic(b'PK') + field('<H')@'version' + records('<I', 'B')@'offsets')@'file')
+    grammar.analyze()
+    data = b'PK\x02\x00' + struct.pack('<B2I', 2, 10, 20)
+
+    state = grammar(data)
+    assert state.tree[:2] == [b'PK', 2]
+    assert list(state.tree[2]) == [10, 20]
+
+    class Recorder(Handler):
+        def __init__(self):
+            self.spans = []
+
+        def token(self, token):
+            self.spans.append((token.start, token.end))
+
+    handler = Recorder()
+    grammar.events(data, handler)
+    assert handler.spans == [(0, 2), (2, 4), (4, 13)]
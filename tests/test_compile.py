@@ -0,0 +1,87 @@
+import pytest
+from comber import C, Lit, rs, inf, compile, generate, ParseError, EndOfInputError
+from .grammars import callGrammar, TEXTS, outcome
+
+def test_compile_same():
+    grammar = callGrammar()
+    parse = compile(grammar)
+
+    for text in TEXTS:
+        assert outcome(parse, text) == outcome(grammar, text)
+
+def test_compile_analyzed():
+    grammar = callGrammar()
+    grammar.analyze()
+    parse = compile(grammar)
+
+    for text in TEXTS:
+        assert outcome(parse, text) == outcome(grammar, text)
+
+def test_compile_fused():
+    octet = rs('[0-9]{1,3}')
+    grammar = C+ '[' + octet + (C+ '.' + octet)[3] + ']'
+    grammar.analyze()
+    parse = compile(grammar)
+
+    assert parse('[127.0.0.1]').tree == ['[', '127', '.', '0', '.', '0', '.', '1', ']']
+
+    with pytest.raises(ParseError) as info:
+        parse('[1.2.3]')
+    assert info.value.offset == 6
+    assert info.value.expected == ['.']
+
+def test_compile_anchored():
+    # Anchors and lookbehinds only see the input from where the match starts, as in the grammar
+    grammar = C+ 'a' + rs(r'^b') + rs(r'(?<!b)[a-z]')
+    parse = compile(grammar)
+
+    for text in ('a b', 'a bc', 'ab', 'a b ^'):
+        assert outcome(parse, text) == outcome(grammar, text)
+
+def test_compile_result():
+    parse = compile(rs(r'[0-9]+')@int + Lit(';'))
+    state = parse('12; rest')
+
+    assert state.result == 12
+    assert state.text == 'rest'
+    assert not state.eof
+
+def test_compile_whitespace():
+    grammar = Lit('a') + 'b'
+    grammar.whitespace = None
+    parse = compile(grammar)
+
+    assert parse('ab').tree == ['a', 'b']
+    assert parse('a.b', '.').tree == ['a', 'b']
+    with pytest.raises(ParseError):
+        parse('a b')
+
+def test_compile_separator():
+    parse = compile(Lit('a')[0, inf, ','])
+
+    state = parse('a, a,')
+    assert state.tree == ['a', ',', 'a']
+    assert state.text == ','
+
+def test_compile_end_of_input():
+    parse = compile(C+ '(' + rs('[a-z]+') + ')')
+
+    with pytest.raises(EndOfInputError):
+        parse('(foo')
+
+def test_generate_standalone():
+    source = generate((C+ '(' + rs(r'[0-9]+')@int + ')')@'group')
+    assert 'comber' not in source.replace('generated by comber', '')
+
+    module = {}
+    exec(source, module)
+    assert module['parse']('( 12 )').tree == ['(', 12, ')']
+
+    with pytest.raises(module['ParseError']) as info:
+        module['parse']('(x)')
+    assert info.value.offset == 1
+    assert info.value.message == '1:2: Unexpected text: x). Expected one of: /[0-9]+/'
+
+def test_generate_lambda():
+    with pytest.raises(ValueError):
+        generate(rs(r'[0-9]+')@(lambda number: int(number)))
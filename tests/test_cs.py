@@ -1,5 +1,5 @@
 import pytest
-from comber import cs, ParseError
+from comber import C, cs, ParseError
 
 def test_create():
     cs('fo')
@@ -22,3 +22,48 @@ def test_parse():
     with pytest.raises(ParseError):
         parser('foo')
 
+
+def test_longest_match():
+    parser = cs(['=', '==', '===', '!='])
+    parser.whitespace = None
+
+    for _ in range(10):
+        assert parser('==').tree == ['==']
+        assert parser('===').tree == ['===']
+        assert parser('=!=').tree == ['=']
+        assert parser('!==').tree == ['!=']
+
+    assert parser.string == ('===', '!=', '==', '=')
+
+def test_parse_end():
+    parser = cs(['ab', 'a'])
+
+    state = parser('a')
+    assert state.tree == ['a']
+
+    with pytest.raises(ParseError):
+        parser('b')
+
+def test_parse_empty():
+    parser = C+ 'x' + cs(['y', ''])
+
+    assert parser('x').tree == ['x', '']
+    assert parser('xy').tree == ['x', 'y']
+
+def test_parse_many():
+    words = [f'word{index}' for index in range(5000)]
+    parser = cs(words)
+
+    assert parser('word4321 ').tree == ['word4321']
+    assert parser('word49990').tree == ['word4999']
+
+    with pytest.raises(ParseError):
+        parser('wor')
+
+def test_bytes():
+    parser = cs(['=', '==', 'é'])
+    assert parser(b'== 1').tree == [b'==']
+    assert parser('é'.encode()).tree == ['é'.encode()]
+
+    with pytest.raises(ParseError):
+        parser(b'1')
@@ -0,0 +1,96 @@
+import pytest
+from comber import C, Lit, rs, inf, Handler, ParseError
+from .grammars import mathGrammar
+
+class Recorder(Handler):
+    def __init__(self):
+        self.events = []
+
+    def enter(self, parser):
+        self.events.append(('enter', parser.name))
+
+    def token(self, token):
+        self.events.append((str(token), token.start))
+
+    def exit(self, parser):
+        self.events.append(('exit', parser.name))
+
+def test_events():
+    handler = Recorder()
+    grammar = (C+ 'let' + rs('[a-z]+')@'name' + '=' + rs('[0-9]+')@'number')@'assignment'
+    state = grammar.events('let x = 5', handler)
+
+    assert state.eof
+    assert state.tree == []
+    assert handler.events == [
+        ('enter', 'assignment'),
+        ('let', 0),
+        ('enter', 'name'), ('x', 4), ('exit', 'name'),
+        ('=', 6),
+        ('enter', 'number'), ('5', 8), ('exit', 'number'),
+        ('exit', 'assignment'),
+        ]
+
+def test_events_backtrack():
+    handler = Recorder()
+    grammar = (C+ 'a' + 'b')@'ab' | (C+ 'a' + 'c')@'ac'
+    grammar.events('a c', handler)
+
+    assert handler.events == [('enter', 'ac'), ('a', 0), ('c', 2), ('exit', 'ac')]
+
+def test_events_no_emit():
+    handler = Recorder()
+    grammar = rs('[0-9]+')@('number', int)
+    grammar.events('12', handler)
+
+    assert handler.events == [('enter', 'number'), ('12', 0), ('exit', 'number')]
+
+def test_events_memo():
+    plain = mathGrammar(convert=False)
+    memoized = mathGrammar(convert=False)
+    memoized.analyze(memoize=True)
+
+    for text in ('1', '1 + 2', '(1 + 2) - 3'):
+        expected = Recorder()
+        plain.events(text, expected)
+        handler = Recorder()
+        memoized.events(text, handler)
+        assert handler.events == expected.events
+
+def test_events_fused():
+    handler = Recorder()
+    octet = rs('[0-9]{1,3}')@'octet'
+    grammar = C+ '[' + octet + (C+ '.' + octet)[3] + ']'
+    grammar.analyze()
+    grammar.events('[1.2.3.4]', handler)
+
+    assert handler.events.count(('enter', 'octet')) == 4
+
+def test_events_incremental():
+    handler = Recorder()
+    grammar = (C+ 'a' + 'b')[0, inf] + 'end'
+
+    with pytest.raises(ParseError):
+        grammar.events('a b a b x', handler)
+
+    assert handler.events == [('a', 0), ('b', 2), ('a', 4), ('b', 6)]
+
+def test_events_analyzed():
+    def grammar():
+        item = (C+ 'a' + 'b') | (C+ 'a' + 'c')@(lambda *leaves: leaves) | (C+ rs('[a-z]+') + ';')
+        return C+ ~Lit('x') + item[0, inf]
+
+    plain = grammar()
+    analyzed = grammar()
+    analyzed.analyze()
+
+    for text in ('x a c', 'a', 'ad; c', 'a ax;ccd', 'x a b a c q;'):
+        expected = Recorder()
+        plain.events(text, expected)
+        handler = Recorder()
+        analyzed.events(text, handler)
+        assert handler.events == expected.events
+
+    handler = Recorder()
+    analyzed.events('x a c', handler)
+    assert handler.events == [('x', 0), ('a', 2), ('c', 4)]
@@ -1,5 +1,6 @@
 import pytest
-from comber import Choice, Repeat, Lit, ParseError
+from comber import C, Choice, Seq, Repeat, Lit, ParseError, EndOfInputError
+from comber.parser import State
 
 
 def test_repr():
@@ -27,3 +28,28 @@ def test_mid_parse_error():
 
     with pytest.raises(ParseError):
         grammar('foo')
+
+def test_furthest_failure():
+    grammar = Choice(C+ 'foo' + 'bar' + 'baz', C+ 'foo' + 'qux')
+
+    with pytest.raises(ParseError) as info:
+        grammar('foo bar qux')
+
+    assert info.value.offset == 8
+    assert info.value.text == 'qux'
+    assert info.value.expected == ['baz']
+
+def test_end_of_input():
+    grammar = Seq('foo', 'bar')
+
+    with pytest.raises(EndOfInputError) as info:
+        grammar('foo')
+
+    assert info.value.expected == ['bar']
+
+def test_failure_without_exception():
+    grammar = Choice(Repeat(Lit('foo'), 2, 5, ','), Lit('bar'))
+    state = State('foo', ' ')
+
+    assert grammar.parseCore(state) is None
+    assert isinstance(state.error(), ParseError)
@@ -0,0 +1,11 @@
+from comber import rs
+
+def test_bytes_pattern_dispatch():
+    # Alternatives are picked by the next byte, which for a bytes pattern isn't the UTF-8 encoding of its first character
+    grammar = rs(b'\xff+') | 'a'
+    assert grammar(b'\xff\xff').tree == [b'\xff\xff']
+
+    grammar.analyze()
+    assert grammar(b'\xff\xff').tree == [b'\xff\xff']
+    assert grammar(b'a').tree == [b'a']
+    assert grammar('\xff').tree == ['\xff']
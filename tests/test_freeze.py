@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from comber import C, Lit
+from .grammars import mathGrammar
+
+def test_freeze():
+    grammar = mathGrammar()
+    grammar.analyze(memoize=True)
+    frozen = grammar.freeze()
+
+    assert frozen is not grammar
+    assert frozen.memoize
+    assert frozen('(1 + 2) - 3').tree == grammar('(1 + 2) - 3').tree == ['(', 1, '+', 2, ')', '-', 3]
+    assert frozen(b'1 + 2').tree == [1, b'+', 2]
+
+def test_freeze_immutable():
+    frozen = (C+ 'a' + 'b').freeze()
+
+    with pytest.raises(TypeError):
+        frozen @ 'ab'
+    with pytest.raises(TypeError):
+        frozen.analyze()
+
+    assert (C+ frozen + 'c')('a b c').tree == ['a', 'b', 'c']
+
+def test_freeze_extend():
+    frozen = (C+ 'a' + 'b').freeze()
+    longer = frozen + 'c'
+    either = frozen | 'c'
+
+    assert longer is not frozen and not longer.frozen
+    assert longer('a b c').tree == ['a', 'b', 'c']
+    assert either('c').tree == ['c']
+    assert frozen('a b').tree == ['a', 'b']
+
+    choice = (C+ 'a' | 'b').freeze()
+
+    assert (choice | 'c')('c').tree == ['c']
+    assert (choice + 'c')('b c').tree == ['b', 'c']
+    assert choice('a').tree == ['a']
+
+    with pytest.raises(TypeError):
+        frozen.subparsers = ()
+
+def test_freeze_unshared():
+    grammar = C+ 'unshared' + 'b'
+    frozen = grammar.freeze()
+    Lit('unshared')@str.upper
+
+    assert grammar('unshared b').tree == ['UNSHARED', 'b']
+    assert frozen('unshared b').tree == ['unshared', 'b']
+
+def test_freeze_threads():
+    frozen = mathGrammar().freeze()
+    texts = [f'({number} + 2) - {number}' for number in range(200)]
+
+    with ThreadPoolExecutor(8) as pool:
+        trees = list(pool.map(lambda text: frozen(text).tree, texts))
+
+    assert trees == [['(', number, '+', 2, ')', '-', number] for number in range(200)]
+
+def test_freeze_nested():
+    frozen = (C+ 'a' + 'b').freeze()
+    grammar = C+ frozen + 'c'
+    grammar.analyze()
+
+    assert grammar('a b c').tree == ['a', 'b', 'c']
+    assert frozen('a b').tree == ['a', 'b']
+
+    refrozen = (C+ frozen + 'c').freeze()
+
+    assert refrozen('a b c').tree == ['a', 'b', 'c']
+    assert refrozen.frozen and frozen.frozen
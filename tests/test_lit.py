@@ -23,3 +23,12 @@ def test_lit_parse():
 
     with pytest.raises(ParseError):
         parser('bar')
+
+def test_bytes():
+    parser = Lit('föo')
+    assert parser('föo bar'.encode()).tree == ['föo'.encode()]
+    assert parser(memoryview(b'f\xc3\xb6o')).tree == [b'f\xc3\xb6o']
+
+    with pytest.raises(ParseError) as info:
+        parser(bytearray(b'bar'))
+    assert info.value.message == '1:1: Unexpected text: bar. Expected one of: föo'
@@ -0,0 +1,113 @@
+import io
+import sys
+import pytest
+from comber import C, rs, defer, Handler, ParseError
+from comber.parser import Memo
+from .grammars import mathGrammar
+
+def test_memo_same_tree():
+    plain = mathGrammar(convert=False, index=True)
+    memoized = mathGrammar(convert=False, index=True)
+    memoized.analyze(memoize=True)
+
+    for text in ('1', '1 + 2', '(1 + 2) - 3', '1[2 + (3)] + ((4))'):
+        assert memoized(text).tree == plain(text).tree
+
+def test_memo_counts():
+    grammar = mathGrammar(convert=False, index=True)
+    grammar.analyze(memoize=True)
+
+    state = grammar('(1 + 2) - 3')
+    assert state.memo.misses > 0
+    assert state.memo.hits > 0
+
+def test_memo_failure():
+    grammar = mathGrammar(convert=False, index=True)
+    grammar.analyze(memoize=True)
+
+    with pytest.raises(ParseError):
+        grammar('(1 + 2')
+
+def test_memo_size():
+    grammar = mathGrammar(convert=False, index=True)
+    grammar.analyze(memoize=True, memoSize=4)
+
+    state = grammar('(1 + 2) - 3')
+    assert state.tree == ['(', '1', '+', '2', ')', '-', '3']
+    assert len(state.memo) == 4
+
+def test_memo_lru():
+    a, b, c = (C+ 'a' + 'b'), (C+ 'a' + 'c'), (C+ 'a' + 'd')
+    state = a.start('a b', None)
+    memo = Memo(2)
+
+    def parse(parser):
+        before = memo.hits
+        memo.parse(parser, state)
+        state.pos = 0
+        return memo.hits > before
+
+    assert not parse(a)
+    assert not parse(b)
+    # Using a makes b the least recently used, and so the one dropped for c
+    assert parse(a)
+    assert not parse(c)
+    assert len(memo) == 2
+    assert parse(a)
+    assert parse(c)
+    assert not parse(b)
+
+def test_left_recursion_heads():
+    grammar = mathGrammar(convert=False, index=True)
+    grammar.analyze(memoize=True)
+
+    assert grammar.subparser.recursionHead
+    assert not grammar.subparser.subparsers[0].memoizable
+    assert not grammar.subparser.subparsers[3].recursionHead
+
+def test_left_recursion_chain():
+    symbol = rs(r'[a-z]+')
+    expression = defer()
+    expression.fill((expression + '.' + symbol) | (expression + '(' + ')') | symbol)
+    expression.analyze(memoize=True)
+
+    state = expression('a.b().c.d()')
+    assert state.text == ''
+    assert state.tree == ['a', '.', 'b', '(', ')', '.', 'c', '.', 'd', '(', ')']
+
+def test_left_recursion_associativity():
+    number = rs(r'[0-9]+')@int
+    expression = defer()
+    expression.fill((expression + '-' + number)@(lambda left, op, right: left - right) | number)
+    expression.analyze(memoize=True)
+
+    assert expression('10 - 3 - 2').tree == [5]
+
+def test_left_recursion_long():
+    grammar = mathGrammar(convert=False, index=True)
+    grammar.analyze(memoize=True)
+
+    state = grammar(' + '.join(['1'] * 60))
+    assert state.text == ''
+    assert len(state.tree) == 119
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason='Python calls use the C stack')
+def test_deep_nesting():
+    expression = defer()
+    expression.fill((C+ '(' + expression + ')' + '!') | (C+ '(' + expression + ')') | rs('[0-9]+'))
+    expression.analyze(memoize=True)
+    text = '(' * 2000 + '1' + ')' * 2000
+    limit = sys.getrecursionlimit()
+
+    class Counter(Handler):
+        tokens = 0
+        def token(self, token):
+            Counter.tokens += 1
+
+    # Far deeper than Python's recursion limit would allow
+    assert len(expression(text).tree) == 4001
+    assert len(list(expression.iterparse(text))) == 4001
+    assert len(expression.parseStream(io.StringIO(text), chunkSize=64).tree) == 4001
+    expression.events(text, Counter())
+    assert Counter.tokens == 4001
+    assert sys.getrecursionlimit() == limit
@@ -0,0 +1,118 @@
+import pickle
+import pytest
+from comber import C, Lit, rs, inf, ParseError
+from .grammars import mathGrammar
+
+def test_pickle():
+    grammar = mathGrammar()
+    grammar.analyze(memoize=True)
+    copy = pickle.loads(pickle.dumps(grammar))
+
+    assert copy('(1 + 2) - 3').tree == grammar('(1 + 2) - 3').tree == ['(', 1, '+', 2, ')', '-', 3]
+    assert pickle.loads(pickle.dumps(Lit('foo'))) is Lit('foo')
+
+def test_pickle_lit():
+    grammar = C+ Lit('pickled')@'name' + 'zzz'
+    pickled = pickle.dumps(grammar)
+    frozen = pickle.dumps(grammar.freeze())
+    Lit('pickled')
+
+    copy = pickle.loads(pickled)
+    assert copy.subparsers[0] is not Lit('pickled')
+    assert copy.subparsers[0].name == 'name'
+    assert copy.subparsers[1] is Lit('zzz')
+
+    # Unpickling never changes the interned literals
+    assert pickle.loads(frozen)('pickled zzz').tree == ['pickled', 'zzz']
+    assert not Lit('zzz').frozen
+    assert Lit('pickled').name is None
+    assert (C+ Lit('zzz') + 'a')('zzz a').tree == ['zzz', 'a']
+
+def test_pickle_error():
+    with pytest.raises(ParseError) as info:
+        mathGrammar()('x + 1')
+
+    error = info.value
+    copy = pickle.loads(pickle.dumps(error))
+
+    assert isinstance(copy, ParseError)
+    assert str(copy) == str(error)
+    assert copy.offset == 0
+
+def test_parse_many():
+    grammar = mathGrammar()
+    grammar.analyze()
+    texts = [f'{number} + ({number} - 1)' if number % 7 else '- 1' for number in range(100)]
+
+    results = list(grammar.parseMany(iter(texts), workers=2, chunksize=8))
+
+    assert len(results) == 100
+    assert results[1] == [1, '+', '(', 1, '-', 1, ')']
+    assert results[99] == [99, '+', '(', 99, '-', 1, ')']
+
+    with pytest.raises(ParseError) as info:
+        grammar('- 1')
+
+    assert isinstance(results[0], ParseError)
+    assert str(results[0]) == str(info.value)
+    assert results[0].parser is info.value.parser
+
+def statements():
+    statement = (C+ rs('[a-z]+')@'name' + '=' + rs('[0-9]+')@('number', int) + ';')@'statement'
+    return statement[0, inf]
+
+def test_parse_split(tmp_path):
+    path = tmp_path / 'statements.txt'
+    text = ''.join(f'a{"b" * (number % 5)} = {number};\n' for number in range(1000))
+    path.write_text(text)
+    grammar = statements()
+    grammar.analyze()
+
+    expected = grammar(text.encode()).tree
+    assert list(grammar.parseSplit(str(path), b';', workers=2, pieces=7)) == expected
+    assert list(grammar.parseSplit(str(path), Lit(';'), workers=2, pieces=7)) == expected
+
+def test_parse_split_error(tmp_path):
+    path = tmp_path / 'statements.txt'
+    path.write_text(''.join(f'a = {number};\n' if number != 900 else 'a = ;\n' for number in range(1000)))
+    grammar = statements()
+    grammar.analyze()
+
+    with pytest.raises(ParseError) as info:
+        list(grammar.parseSplit(str(path), '\n', workers=2))
+
+    assert info.value.line == 901
+    assert info.value.char == 5
+    assert info.value.text.startswith(b';\na = 901;')
+    assert info.value.expected == ['number']
+
+def test_parse_split_empty(tmp_path):
+    path = tmp_path / 'empty.txt'
+    path.write_text('')
+
+    assert list(statements().parseSplit(str(path), ';')) == []
+
+def test_parse_split_grammar(tmp_path):
+    path = tmp_path / 'statements.txt'
+    path.write_text('a = 1;\n')
+    statement = statements().subparser
+
+    # Only a repetition can be split into pieces, and the pieces can't be counted or emitted together
+    for grammar in (statement, statement[0, 10], statement[0, inf]@list):
+        with pytest.raises(TypeError):
+            list(grammar.parseSplit(str(path), ';'))
+
+def test_parse_split_separator(tmp_path):
+    path = tmp_path / 'statements.txt'
+    text = ';\n'.join(f'a{"b" * (number % 5)} = {number}' for number in range(1000))
+    path.write_text(text)
+    grammar = (C+ rs('[a-z]+')@'name' + '=' + rs('[0-9]+')@('number', int))[1, inf, ';']
+
+    # Each piece after the first starts with the separator after the last item of the one before
+    expected = grammar(text.encode()).tree
+    values = list(grammar.parseSplit(str(path), rb'[0-9]+', workers=2, pieces=7))
+    assert values == expected
+    assert {type(value) for value in values} == {bytes, int}
+
+    grammar.analyze()
+    assert list(grammar.parseSplit(str(path), rs('[0-9]+'), workers=2, pieces=7)) == expected
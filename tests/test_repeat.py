@@ -128,3 +128,26 @@ def test_emit():
     
     parser('foo')
     assert called
+
+def test_trailing_separator():
+    parser = Lit('foo')[0, inf, ',']
+
+    state = parser('foo, foo,')
+    assert state.text == ','
+    assert state.tree == ['foo', ',', 'foo']
+
+def test_iterparse():
+    parser = (C+ 'foo' + Lit('bar')@(lambda bar: bar.upper()))[0, inf, ',']
+    text = 'foo bar, foo bar, foo bar'
+
+    assert list(parser.iterparse(text)) == parser(text).tree
+
+def test_iterparse_incremental():
+    parser = ((C+ 'foo' + 'bar')@(lambda foo, bar: foo + bar))[3]
+    items = parser.iterparse('foo bar foo bar foo baz')
+
+    assert next(items) == 'foobar'
+    assert next(items) == 'foobar'
+    with pytest.raises(ParseError) as info:
+        next(items)
+    assert info.value.offset == 20
@@ -1,5 +1,6 @@
 import pytest
-from comber import rs, ParseError
+from comber import C, Lit, rs, ParseError
+from comber.extras import regexFirst, looksBehind
 
 def test_create():
     rs('foo')
@@ -41,3 +42,71 @@ def test_emit():
     
     parser('foo')
     assert called
+
+def test_first():
+    assert regexFirst('[+-]?[0-9]+') == (frozenset('+-0123456789'), False)
+    assert regexFirst('(?:ab|c)d') == (frozenset('ac'), False)
+    assert regexFirst(r'\bfoo|bar?') == (frozenset('bf'), False)
+    assert regexFirst('a*') == (frozenset('a'), True)
+    assert regexFirst('[^a]')[0] is None
+    assert regexFirst(r'\w+')[0] is None
+    assert regexFirst('(?i)a')[0] is None
+    assert regexFirst('[a-c]', True)[0] == frozenset('abcABC')
+    assert regexFirst('k', True)[0] == frozenset('kK\u212a')
+
+def test_bytes():
+    assert rs('[a-z]+')(b'foo bar').tree == [b'foo']
+    assert rs(b'[\x80-\xff]+')(b'\x80\xff!').tree == [b'\x80\xff']
+    assert rs(b'[\x80-\xff]+')('\x80\xff!').tree == ['\x80\xff']
+
+    with pytest.raises(ParseError):
+        rs('[a-z]+')(b'123')
+
+def test_bytes_non_ascii():
+    # Encoding the pattern would make the class match single bytes of é's encoding
+    parser = rs('[é]+')
+    assert parser('éé').tree == ['éé']
+
+    with pytest.raises(ValueError):
+        parser('é'.encode())
+    grammar = parser + 'x'
+    grammar.analyze()
+    with pytest.raises(ValueError):
+        grammar('éx'.encode())
+
+    assert rs('(?:é)+'.encode())('éé'.encode()).tree == ['éé'.encode()]
+
+def test_looks_behind():
+    assert looksBehind(r'^[0-9]+')
+    assert looksBehind(r'a|\Ab')
+    assert looksBehind(r'(?<!a)b')
+    assert not looksBehind(r'[^a]+')
+    assert not looksBehind(r'[]^]\^')
+
+def test_anchored():
+    # Anchors and lookbehinds only see the input from where the match starts
+    grammar = Lit('a') + rs(r'^[0-9]+') + rs(r'(?<![0-9])[a-z]+')
+    assert grammar('a12b').tree == ['a', '12', 'b']
+    assert grammar(b'a12b').tree == [b'a', b'12', b'b']
+
+    grammar.analyze()
+    assert grammar('a12b').tree == ['a', '12', 'b']
+
+def test_word_boundary():
+    # Word boundaries see the character before the match, unlike anchors
+    for grammar in (Lit('a') + rs(r'\bb'), Lit('a') + rs(r'\bb')@'b'):
+        assert grammar('a b').tree == ['a', 'b']
+        assert grammar(b'a b').tree == [b'a', b'b']
+
+        with pytest.raises(ParseError):
+            grammar('ab')
+
+        grammar.analyze()
+        with pytest.raises(ParseError):
+            grammar('ab')
+
+    grammar = Lit('a') + rs(r'\Bb')
+    assert grammar('ab').tree == ['a', 'b']
+
+    with pytest.raises(ParseError):
+        grammar('a b')
@@ -0,0 +1,97 @@
+import mmap
+import pytest
+from comber import C, Lit, rs, cs, inf, ParseError
+from comber.parser import State, LineIndex, Token
+
+def test_state_offset():
+    state = State('foo bar', ' ')
+    state.consume(3)
+    assert state.source == 'foo bar'
+    assert state.pos == 4
+    assert state.text == 'bar'
+    assert state.tree == ['foo']
+    assert not state.eof
+
+    state.consume(3)
+    assert state.source == 'foo bar'
+    assert state.text == ''
+    assert state.eof
+
+def test_state_lines():
+    parser = C+ 'foo' + 'bar' + 'baz'
+    state = parser('foo\n  bar baz')
+    assert state.line == 2
+    assert state.char == 10
+
+def test_line_index():
+    lines = LineIndex('foo\nbar\n\nbaz')
+    assert lines.position(0) == (1, 1)
+    assert lines.position(3) == (1, 4)
+    assert lines.position(4) == (2, 1)
+    assert lines.position(8) == (3, 1)
+    assert lines.position(11) == (4, 3)
+    assert lines.position(12) == (4, 4)
+
+def test_rs_offset():
+    parser = C+ 'foo' + rs('[a-z]+')
+    state = parser('foo bar')
+    assert state.tree == ['foo', 'bar']
+
+def test_error_offset():
+    parser = C+ 'foo' + Lit('bar')@'bar'
+
+    with pytest.raises(ParseError) as info:
+        parser('foo\n baz')
+
+    assert info.value.offset == 5
+    assert info.value.text == 'baz'
+    assert info.value.line == 2
+    assert info.value.char == 2
+
+def test_state_rollback():
+    state = State('foo bar baz', ' ')
+    state.consume(3)
+    mark = state.mark()
+
+    state.pushBranch()
+    state.consume(3)
+    state.consume(3)
+    state.rollback(mark)
+
+    assert state.pos == 4
+    assert state.tree == ['foo']
+    assert state.text == 'bar baz'
+
+def test_state_spans():
+    state = State('foo bar', ' ', spans=True)
+    state.consume(3)
+    state.consume(3)
+
+    assert state.tree == ['foo', 'bar']
+    token = state.tree[1]
+    assert isinstance(token, Token)
+    assert (token.start, token.end) == (4, 7)
+    assert str(token) == 'bar'
+
+def test_fused_spans():
+    octet = rs('[0-9]{1,3}')
+    parser = C+ '[' + octet + (C+ '.' + octet)[3] + ']'
+    parser.analyze()
+
+    state = parser('[127.0.0.1]', spans=True)
+    assert state.tree == ['[', '127', '.', '0', '.', '0', '.', '1', ']']
+    assert [token.start for token in state.tree] == [0, 1, 4, 5, 6, 7, 8, 9, 10]
+
+def test_state_mmap(tmp_path):
+    parser = (C+ rs('[a-z]+') + '=' + (rs('[0-9]+')@int | C+ '"' + rs('[^"]*') + '"'))[0, inf, ';']
+    parser.analyze()
+    path = tmp_path / 'input'
+    path.write_bytes(b'foo = 12;\nbar = "baz"')
+
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        state = parser(mapped)
+        assert state.tree == [b'foo', b'=', 12, b';', b'bar', b'=', b'"', b'baz', b'"']
+        assert state.eof
+
+        assert [token.start for token in parser(mapped, spans=True).tree[-3:]] == [16, 17, 20]
+        assert (state.line, state.char) == (2, 12)
@@ -0,0 +1,162 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from comber import C, rs, inf, ParseError
+from comber.parser import StreamState
+
+def assignments(minimum=0, maximum=inf):
+    return (C+ rs('[a-z]+') + '=' + rs('[0-9]+')@int)[minimum, maximum, ';']
+
+TEXT = ';\n'.join(f'{"x" * (index % 13 + 1)} = {index}' for index in range(500))
+
+def test_stream_file():
+    grammar = assignments()
+    state = grammar.parseStream(io.StringIO(TEXT), chunkSize=16)
+
+    assert state.tree == grammar(TEXT).tree
+    assert state.eof
+
+def test_stream_chunks():
+    grammar = assignments()
+    chunks = [TEXT[start:start + 3] for start in range(0, len(TEXT), 3)]
+
+    # Leaves longer than the window read on until they end
+    assert grammar.parseStream(chunks, chunkSize=4).tree == grammar(TEXT).tree
+
+def test_stream_whitespace():
+    grammar = assignments()
+    text = 'a' + ' ' * 100 + '= 1'
+
+    assert grammar.parseStream(io.StringIO(text), chunkSize=8).tree == ['a', '=', 1]
+
+def test_stream_whitespace_window():
+    grammar = (C+ 'ab' | 'cd')[0, inf]
+
+    # Runs of whitespace longer than the window mustn't leave the next leaf short of input
+    for text in ('ab      cd      ab', 'ab cd          ab', 'ab' + ' ' * 20 + 'cd' + ' ' * 20 + 'ab'):
+        for chunkSize in (2, 3, 4, 8):
+            assert grammar.parseStream(io.StringIO(text), chunkSize=chunkSize).tree == ['ab', 'cd', 'ab']
+
+def test_stream_bounded():
+    grammar = assignments()
+    largest = 0
+
+    class Buffer(StreamState):
+        def fill(self, size):
+            nonlocal largest
+            super().fill(size)
+            largest = max(largest, len(self.source))
+
+    state = grammar.start('', None, kind=Buffer, chunks=iter(TEXT), window=32)
+    for newState in grammar.items(state):
+        newState.release()
+
+    assert newState.base > len(TEXT) - 64
+    assert largest < 100
+
+def test_stream_rest():
+    state = assignments().parseStream(io.StringIO(TEXT + '; foo'), chunkSize=16)
+
+    assert state.text == '; foo'
+    assert state.base + state.pos == len(TEXT)
+
+def test_stream_error():
+    grammar = assignments(501, None)
+    text = TEXT + ';\nfoo = x'
+
+    with pytest.raises(ParseError) as streamed:
+        grammar.parseStream(io.StringIO(text), chunkSize=16)
+
+    with pytest.raises(ParseError) as parsed:
+        grammar(text)
+
+    assert streamed.value.offset == parsed.value.offset == len(text) - 1
+    assert (streamed.value.line, streamed.value.char) == (501, 7)
+    assert streamed.value.text == 'x'
+
+def test_stream_not_repeat():
+    grammar = C+ 'a' + rs('[0-9]+') + 'b'
+
+    assert grammar.parseStream(['a 1', '23 ', 'b']).tree == ['a', '123', 'b']
+
+def test_stream_bytes():
+    grammar = assignments()
+
+    assert grammar.parseStream(io.BytesIO(TEXT.encode()), chunkSize=16).tree == grammar(TEXT.encode()).tree
+
+def test_async_reader():
+    grammar = assignments()
+    steps = []
+
+    async def parse():
+        reader = asyncio.StreamReader()
+
+        async def feed():
+            for start in range(0, len(TEXT), 100):
+                reader.feed_data(TEXT[start:start + 100].encode())
+                await asyncio.sleep(0)
+            reader.feed_eof()
+
+        async def tick():
+            while True:
+                steps.append(None)
+                await asyncio.sleep(0)
+
+        feeding = asyncio.create_task(feed())
+        ticking = asyncio.create_task(tick())
+        state = await grammar.parseAsync(reader, chunkSize=32, steps=10)
+        ticking.cancel()
+        await feeding
+        return state
+
+    state = asyncio.run(parse())
+    assert state.tree == grammar(TEXT.encode()).tree
+    assert state.eof
+    assert len(steps) > 1
+
+def test_async_iterable():
+    grammar = assignments()
+
+    async def chunks():
+        for start in range(0, len(TEXT), 7):
+            yield TEXT[start:start + 7]
+
+    assert asyncio.run(grammar.parseAsync(chunks(), chunkSize=16)).tree == grammar(TEXT).tree
+
+def test_async_error():
+    grammar = assignments(2)
+
+    async def chunks():
+        yield 'a = 1; b = '
+        yield 'x'
+
+    with pytest.raises(ParseError):
+        asyncio.run(grammar.parseAsync(chunks()))
+
+def test_async_executor():
+    grammar = assignments()
+
+    async def parse(executor):
+        # The first parse waits on input that only comes once the second is done
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+        second = asyncio.Event()
+
+        async def waiting():
+            yield 'a = 1; '
+            await second.wait()
+            yield 'b = 2'
+
+        async def chunks():
+            yield 'c = 3'
+
+        first = asyncio.create_task(grammar.parseAsync(waiting(), executor=executor))
+        await asyncio.sleep(0.01)
+        state = await asyncio.wait_for(grammar.parseAsync(chunks(), executor=executor), 5)
+        second.set()
+        return (await first).tree, state.tree
+
+    assert asyncio.run(parse(None)) == (['a', '=', 1, ';', 'b', '=', 2], ['c', '=', 3])
+
+    with ThreadPoolExecutor(2) as executor:
+        assert asyncio.run(parse(executor)) == (['a', '=', 1, ';', 'b', '=', 2], ['c', '=', 3])
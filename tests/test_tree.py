@@ -0,0 +1,42 @@
+import pytest
+from comber import C, rs, inf, compact, ParseError
+from comber.tree import RULE, TOKEN
+from .grammars import mathGrammar
+
+def test_compact_nodes():
+    tree = compact(mathGrammar(), '(1 + 23)')
+
+    assert [node.kind for node in tree] == [RULE, TOKEN, RULE, RULE, RULE, TOKEN, TOKEN, RULE, RULE, TOKEN, TOKEN]
+    root = tree.roots[0]
+    assert root.name == 'expression'
+    assert (root.start, root.end) == (0, 8)
+    assert [child.text for child in root.children] == ['(', '1 + 23', ')']
+
+    number = tree[-3]
+    assert number.name == 'number'
+    assert (number.start, number.end) == (5, 7)
+    assert number.parent.text == '23'
+    assert number.values == [23]
+
+def test_compact_same_tree():
+    grammar = mathGrammar()
+
+    for text in ('1', '1 + 2', '(1 + 2) - 3', '((4))'):
+        assert compact(grammar, text).tree == grammar(text).tree
+
+def test_compact_empty_node():
+    grammar = C+ 'a' + (C+ rs('b')[0, inf])@'bs' + 'c'
+    tree = compact(grammar, 'a c')
+
+    assert [(node.name, node.start, node.end) for node in tree] \
+        == [(None, 0, 1), ('bs', 1, 1), (None, 2, 3)]
+
+def test_compact_error():
+    with pytest.raises(ParseError):
+        compact(mathGrammar(), '(1 +')
+
+def test_compact_analyzed():
+    grammar = C+ 'x' + ((C+ 'a' + 'b') | (C+ 'a' + 'c')@(lambda *leaves: leaves))
+    grammar.analyze()
+
+    assert compact(grammar, 'x a c').tree == grammar('x a c').tree == ['x', ('a', 'c')]
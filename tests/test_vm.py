@@ -0,0 +1,113 @@
+import pytest
+from comber import C, Lit, rs, defer, assemble, ParseError, EndOfInputError
+from comber.vm import CHOICE, FAIL
+from .grammars import callGrammar, TEXTS, outcome
+
+def test_vm_same():
+    grammar = callGrammar()
+    program = assemble(grammar)
+
+    for text in TEXTS:
+        assert outcome(program, text) == outcome(grammar, text)
+
+def test_vm_analyzed():
+    grammar = callGrammar()
+    grammar.analyze()
+    program = assemble(grammar)
+
+    for text in TEXTS:
+        assert outcome(program, text) == outcome(grammar, text)
+
+def test_vm_fused():
+    octet = rs('[0-9]{1,3}')
+    grammar = C+ '[' + octet + (C+ '.' + octet)[3] + ']'
+    grammar.analyze()
+    program = assemble(grammar)
+
+    assert program('[127.0.0.1]').tree == ['[', '127', '.', '0', '.', '0', '.', '1', ']']
+
+    with pytest.raises(ParseError) as info:
+        program('[1.2.3]')
+    assert info.value.offset == 6
+
+def test_vm_anchored():
+    # Anchors and lookbehinds only see the input from where the match starts, as in the grammar
+    grammar = C+ 'a' + rs(r'^b') + rs(r'(?<!b)[a-z]')
+    program = assemble(grammar)
+
+    for text in ('a b', 'a bc', 'ab', 'a b ^'):
+        assert outcome(program, text) == outcome(grammar, text)
+
+def test_vm_repeat():
+    program = assemble(Lit('a')[1, 3, ','])
+
+    assert program('a').tree == ['a']
+    assert program('a, a, a, a').tree == ['a', ',', 'a', ',', 'a']
+    assert program('a, a,').text == ','
+
+    with pytest.raises(EndOfInputError):
+        program('')
+
+def test_vm_deep():
+    expression = defer()
+    expression.fill((C+ '(' + expression + ')') | rs('[0-9]+'))
+    program = assemble(expression)
+
+    state = program('(' * 5000 + '1' + ')' * 5000)
+    assert state.text == ''
+    assert len(state.tree) == 10001
+
+def groupGrammar():
+    # Each level tries both alternatives on the same parentheses, which is exponential without memoization
+    expression = defer()
+    expression.fill((C+ '(' + expression + ')' + '!') | (C+ '(' + expression + ')') | rs('[0-9]+'))
+    return expression
+
+GROUPS = ['1', '(1)', '((1)!)', '((1))!', '((1)', '(1)!)', '(x)', '']
+
+def test_vm_memo():
+    plain = groupGrammar()
+    plain.analyze()
+    grammar = groupGrammar()
+    grammar.analyze(memoize=True)
+    program = assemble(grammar)
+
+    for text in GROUPS:
+        assert outcome(program, text) == outcome(grammar, text) == outcome(assemble(plain), text)
+
+def test_vm_memo_left_recursion():
+    # Memoized parses grow left-recursive matches, which the machine doesn't
+    grammar = callGrammar()
+    grammar.analyze(memoize=True)
+
+    with pytest.raises(TypeError):
+        assemble(grammar)
+
+def test_vm_memo_deep():
+    expression = groupGrammar()
+    expression.analyze(memoize=True)
+    program = assemble(expression)
+
+    state = program('(' * 5000 + '1' + ')' * 5000)
+    assert state.text == ''
+    assert len(state.tree) == 10001
+
+def test_vm_memo_size():
+    plain = groupGrammar()
+    plain.analyze()
+
+    # Outcomes dropped from a small memo are parsed again
+    for memoSize in (0, 1, 4):
+        grammar = groupGrammar()
+        grammar.analyze(memoize=True, memoSize=memoSize)
+        program = assemble(grammar)
+        assert program.memoSize == memoSize
+
+        for text in GROUPS:
+            assert outcome(program, text) == outcome(assemble(plain), text)
+
+def test_vm_listing():
+    program = assemble(Lit('a') | 'b')
+    assert [opcode for opcode, _, _ in program.code].count(CHOICE) == 1
+    assert 'LIT' in str(program)
+    assert FAIL not in (opcode for opcode, _, _ in program.code)
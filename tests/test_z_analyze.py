@@ -1,5 +1,5 @@
 import pytest
-from comber import defer, ParseError, Lit
+from comber import C, defer, cs, rs, ParseError, Lit
 from comber.combinator import Choice
 
 def test_analyze_choice():
@@ -33,3 +33,89 @@ def test_analyze_deep():
     assert isinstance(grammar.subparsers[0], defer)
     grammar.analyze()
     assert isinstance(grammar.subparsers[0], Choice)
+
+
+def test_analyze_first():
+    number = rs('[+-]?[0-9]+')
+    grammar = (C+ '(' + number + ')') | cs(['let', 'set']) | ~Lit('x') + 'y' | number
+
+    grammar.analyze()
+    assert grammar.subparsers[0].first == frozenset('(')
+    assert grammar.subparsers[1].first == frozenset('ls')
+    assert grammar.subparsers[2].first == frozenset('xy')
+    assert grammar.subparsers[3].first == frozenset('+-0123456789')
+    assert not grammar.nullable
+
+
+def test_analyze_nullable():
+    grammar = ~Lit('x') + (C| 'y' | +Lit('z'))
+
+    grammar.analyze()
+    assert grammar.nullable
+    assert grammar.first == frozenset('xyz')
+
+
+def test_analyze_dispatch():
+    single = defer()
+    single.fill((single + 'bar') | 'foo' | rs(r'\w+') | (C+ '(' + single + ')'))
+    grammar = single | 'baz'
+    grammar.analyze()
+
+    assert grammar('foo bar').tree == ['foo', 'bar']
+    assert grammar('(foo)').tree == ['(', 'foo', ')']
+    assert grammar('qux').tree == ['qux']
+
+    with pytest.raises(ParseError) as info:
+        grammar('(foo')
+    assert info.value.offset == 4
+
+
+def test_analyze_fuse():
+    digits = rs('[0-9]{1,3}')
+    grammar = (C+ '[' + digits + (C+ '.' + digits)[3] + ']') | (C+ 'x' + ~cs(['y', 'yy']) + 'z')
+
+    plain = [grammar(text).tree for text in ('[1.22.3.4]', 'x yy z', 'xz')]
+    grammar.analyze()
+
+    assert grammar.fused
+    assert [grammar(text).tree for text in ('[1.22.3.4]', 'x yy z', 'xz')] == plain
+
+    with pytest.raises(ParseError) as info:
+        grammar('[1.2.3]')
+    assert info.value.offset == 6
+
+
+def test_analyze_fuse_separator():
+    grammar = C+ '(' + rs('[a-z]+')[1, 3, ','] + ')'
+    grammar.analyze()
+
+    assert grammar('(a, b)').tree == ['(', 'a', ',', 'b', ')']
+    assert grammar('(a,b,c)').tree == ['(', 'a', ',', 'b', ',', 'c', ')']
+
+    with pytest.raises(ParseError):
+        grammar('(a,b,c,d)')
+
+
+def test_analyze_fuse_emitter():
+    number = rs('[0-9]+')@int
+    grammar = (C+ '(' + number + ')') | (C+ 'x' + 'y')
+    grammar.analyze()
+
+    assert grammar('(12)').tree == ['(', 12, ')']
+    assert grammar('x y').tree == ['x', 'y']
+
+
+def test_analyze_fuse_fallback():
+    # The emitter keeps the Choice from fusing, so its fused first alternative falls back on its own
+    grammar = C+ 'x' + ((C+ 'a' + 'b') | (C+ 'a' + 'c')@(lambda *leaves: leaves))
+    plain = C+ 'x' + ((C+ 'a' + 'b') | (C+ 'a' + 'c')@(lambda *leaves: leaves))
+    grammar.analyze()
+
+    assert grammar('x a c').tree == ['x', ('a', 'c')]
+
+    with pytest.raises(ParseError) as expected:
+        plain('x a d')
+    with pytest.raises(ParseError) as info:
+        grammar('x a d')
+    assert str(info.value) == str(expected.value)
+    assert info.value.expected == ['c']
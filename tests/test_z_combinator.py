@@ -1,5 +1,5 @@
 import pytest
-from comber import C, Id, Lit, Seq, Choice, Repeat, inf, EndOfInputError
+from comber import C, Id, Lit, Seq, Choice, Repeat, rs, inf, EndOfInputError, Token, takesTokens
 
 def test_wrap():
     parser = C('foo')
@@ -59,6 +59,39 @@ def test_emit():
     value = state.tree[0]
     assert value.args == ('foo', 'bar')
 
+def test_emit_unbuilt():
+    def emitter(*args):
+        nonlocal called
+        called = True
+    called = False
+    parser = (C + 'foo' + 'bar')@emitter
+
+    state = parser('foobar', build=False)
+    assert state.tree == []
+    assert not called
+
+def test_emit_spans():
+    parser = (C + 'foo' + 'bar')@(lambda foo, bar: foo + bar)
+    assert parser('foo bar', spans=True).tree == ['foobar']
+
+    parser = (C + 'foo' + 'bar')@takesTokens(lambda foo, bar: (foo.start, bar.start))
+    assert parser('foo bar', spans=True).tree == [(0, 4)]
+
+def test_emit_deferred():
+    calls = []
+    def emitter(*args):
+        calls.append(args)
+        return ''.join(args)
+    word = rs('[a-z]+')@emitter
+    parser = (C+ word + '!') | (C+ word + '?')
+
+    assert parser('foo ?').tree == ['foo', '?']
+    assert len(calls) == 2
+
+    calls.clear()
+    assert parser('foo ?', deferred=True).tree == ['foo', '?']
+    assert calls == [('foo', )]
+
 def test_optional():
     parser = ~Lit('foo')
     repeated = Repeat(Lit('foo'), 0, 1, None)
@@ -1,3 +1,5 @@
+import pytest
+from comber import ParseError
 from emailrfc import mailbox, addressliteral
 
 def test_simple_address():
@@ -11,3 +13,16 @@ def test_ipaddress():
     state = mailbox('foo@[127.0.0.1]')
     assert state.text == ''
     assert state.tree == ['foo', '@', '[', '127', '.', '0', '.', '0', '.', '1', ']']
+
+def test_validate():
+    assert mailbox.matches('foo@bar.com') == 11
+    assert mailbox.matches('foo@[127.0.0.1]') == 15
+    assert mailbox.matches('foo@[127.0.0]') is None
+
+    state = mailbox('foo.bar@baz.com', build=False)
+    assert state.text == ''
+    assert state.tree == []
+
+    with pytest.raises(ParseError) as info:
+        mailbox('foo@[127.0.0]', build=False)
+    assert info.value.offset == 12